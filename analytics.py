@@ -0,0 +1,181 @@
+import time
+import threading
+import numpy as np
+
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+
+class MistakeAnalytics:
+    """Vectorized mistake and accuracy analytics for learner dashboards"""
+
+    def __init__(self, tracker, cache_ttl=300, max_cache_entries=1024):
+        """Wrap a MistakeTracker and keep a small TTL cache of computed results"""
+        self.tracker = tracker
+        self.cache_ttl = cache_ttl
+        self.max_cache_entries = max_cache_entries
+        self._cache = {}
+        self._lock = threading.Lock()
+        # New mistakes drop the affected cached results instead of waiting for the TTL
+        listeners = getattr(tracker, "mistake_listeners", None)
+        if listeners is not None:
+            listeners.append(self.invalidate)
+
+    def _cached(self, key, compute):
+        """Return a cached result for key or compute and store it"""
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and now - entry[0] < self.cache_ttl:
+                return entry[1]
+
+        result = compute()
+
+        with self._lock:
+            if len(self._cache) >= self.max_cache_entries:
+                # Drop the oldest entry to keep memory bounded
+                oldest = min(self._cache, key=lambda k: self._cache[k][0])
+                del self._cache[oldest]
+            self._cache[key] = (now, result)
+        return result
+
+    def invalidate(self, user_name=None, language_name=None):
+        """Drop cached results for a user and/or language (all if neither given)"""
+        with self._lock:
+            for key in list(self._cache):
+                users, language = key[1], key[2]
+                if user_name is not None and user_name not in users:
+                    continue
+                # Results over all languages (None) include every language
+                if language_name is not None and language is not None and language != language_name:
+                    continue
+                del self._cache[key]
+
+    def _since(self, window_days):
+        """Convert a window in days into a unix timestamp lower bound"""
+        if not window_days:
+            return None
+        return int(time.time()) - int(window_days) * DAY_SECONDS
+
+    def _load_mistakes(self, user_names, language_name, window_days):
+        """Pull mistake rows into NumPy arrays with integer-coded users and categories"""
+        rows = self.tracker.fetch_mistake_rows(user_names, language_name, self._since(window_days))
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return np.empty(0, dtype=object), empty, np.empty(0, dtype=object), empty, empty
+
+        users, categories, timestamps = zip(*rows)
+        user_labels, user_codes = np.unique(np.array(users, dtype=object), return_inverse=True)
+        category_labels, category_codes = np.unique(np.array(categories, dtype=object), return_inverse=True)
+        timestamps = np.fromiter((ts or 0 for ts in timestamps), dtype=np.int64, count=len(rows))
+        return user_labels, user_codes, category_labels, category_codes, timestamps
+
+    def category_summary(self, user_name, language_name=None, window_days=None):
+        """Mistake counts and shares per category, most frequent first"""
+        key = ("category_summary", (user_name,), language_name, window_days)
+
+        def compute():
+            _, _, labels, codes, _ = self._load_mistakes([user_name], language_name, window_days)
+            if not len(codes):
+                return []
+            counts = np.bincount(codes, minlength=len(labels))
+            order = np.argsort(-counts, kind="stable")
+            total = counts.sum()
+            return [
+                {"category": labels[i], "count": int(counts[i]), "share": float(counts[i] / total)}
+                for i in order
+            ]
+
+        return self._cached(key, compute)
+
+    def weekly_trends(self, user_name, language_name=None, window_days=84):
+        """Mistakes per category per week over the window"""
+        key = ("weekly_trends", (user_name,), language_name, window_days)
+
+        def compute():
+            _, _, labels, codes, timestamps = self._load_mistakes([user_name], language_name, window_days)
+            if not len(codes):
+                return {"weeks": [], "categories": {}, "totals": []}
+
+            start = (timestamps.min() // WEEK_SECONDS) * WEEK_SECONDS
+            week_index = (timestamps - start) // WEEK_SECONDS
+            num_weeks = int(week_index.max()) + 1
+
+            # One bincount over a flattened (category, week) index instead of a loop per category
+            grid = np.bincount(codes * num_weeks + week_index, minlength=len(labels) * num_weeks)
+            grid = grid.reshape(len(labels), num_weeks)
+
+            weeks = [time.strftime("%Y-%m-%d", time.gmtime(int(start + w * WEEK_SECONDS))) for w in range(num_weeks)]
+            return {
+                "weeks": weeks,
+                "categories": {labels[i]: grid[i].tolist() for i in range(len(labels))},
+                "totals": grid.sum(axis=0).tolist(),
+            }
+
+        return self._cached(key, compute)
+
+    def accuracy_over_time(self, user_name, language_name=None, window_days=None, rolling=5):
+        """Per-session accuracy with a rolling mean and percentile bands"""
+        key = ("accuracy_over_time", (user_name,), language_name, window_days, rolling)
+
+        def compute():
+            rows = self.tracker.fetch_session_rows([user_name], language_name, self._since(window_days))
+            if not rows:
+                return {"sessions": [], "accuracy": [], "rolling": [], "percentiles": {}}
+
+            _, starts, accuracy, _ = zip(*rows)
+            accuracy = np.array([a if a is not None else 0.0 for a in accuracy], dtype=np.float64)
+
+            # Rolling mean via cumulative sums; the first windows use however many sessions exist
+            window = max(1, min(int(rolling), len(accuracy)))
+            cumsum = np.cumsum(np.insert(accuracy, 0, 0.0))
+            counts = np.minimum(np.arange(1, len(accuracy) + 1), window)
+            rolling_mean = (cumsum[1:] - cumsum[np.arange(1, len(accuracy) + 1) - counts]) / counts
+
+            p25, p50, p75 = np.percentile(accuracy, [25, 50, 75])
+            return {
+                "sessions": [time.strftime("%Y-%m-%d %H:%M", time.gmtime(int(ts or 0))) for ts in starts],
+                "accuracy": accuracy.tolist(),
+                "rolling": rolling_mean.tolist(),
+                "percentiles": {"p25": float(p25), "p50": float(p50), "p75": float(p75)},
+            }
+
+        return self._cached(key, compute)
+
+    def cohort_comparison(self, user_names, language_name=None, window_days=28):
+        """Compare mistake volume and category mix across a cohort of learners"""
+        user_names = tuple(sorted(set(user_names)))
+        key = ("cohort_comparison", user_names, language_name, window_days)
+
+        def compute():
+            user_labels, user_codes, labels, codes, _ = self._load_mistakes(list(user_names), language_name, window_days)
+            if not len(codes):
+                return {"learners": {}, "percentiles": {}, "categories": {}}
+
+            # learners x categories count matrix
+            matrix = np.bincount(user_codes * len(labels) + codes, minlength=len(user_labels) * len(labels))
+            matrix = matrix.reshape(len(user_labels), len(labels))
+            totals = matrix.sum(axis=1)
+
+            # Learners with no mistakes in the window still count towards the cohort
+            per_learner = dict(zip(user_labels.tolist(), totals.tolist()))
+            all_totals = np.array([per_learner.get(name, 0) for name in user_names], dtype=np.int64)
+            p50, p90, p99 = np.percentile(all_totals, [50, 90, 99])
+
+            # Share of each category per learner, averaged across learners with mistakes
+            shares = matrix / np.maximum(totals, 1)[:, None]
+            return {
+                "learners": {name: int(per_learner.get(name, 0)) for name in user_names},
+                "percentiles": {"p50": float(p50), "p90": float(p90), "p99": float(p99)},
+                "categories": {labels[i]: float(v) for i, v in enumerate(shares.mean(axis=0))},
+            }
+
+        return self._cached(key, compute)
+
+    def dashboard(self, user_name, language_name=None, window_days=84):
+        """All per-learner analytics in one payload"""
+        return {
+            "categories": self.category_summary(user_name, language_name, window_days),
+            "weekly_trends": self.weekly_trends(user_name, language_name, window_days),
+            "accuracy": self.accuracy_over_time(user_name, language_name, window_days),
+        }
@@ -1,9 +1,22 @@
 import os
 import json
-from flask import Flask, render_template, request, jsonify, session
+import time
+import hmac
+import hashlib
+import functools
+from flask import Flask, render_template, request, jsonify, session, g, Response, make_response
 from flask_socketio import SocketIO
 from dotenv import load_dotenv
-from language_learning_bot import LanguageLearningBot
+from language_learning_bot import LanguageLearningBot, TokenBudgetExceeded
+from sharding import get_tracker
+from analytics import MistakeAnalytics
+from metrics import registry
+from async_support import ASYNC_MODE, run_blocking
+from prefetch import prefetch_executor, opener_pool, opener_key
+from event_log import EventLogStore
+from retention import RetentionScheduler
+from http_cache import ResponseCompressor, StaticFingerprints, IMMUTABLE_CACHE_CONTROL
+from profiler import Profiler, render_flamegraph
 from langchain.chains import LLMChain
 from langchain.prompts import ChatPromptTemplate
 
@@ -13,11 +26,123 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "language-learning-secret-key")
-socketio = SocketIO(app)
+socketio = SocketIO(app, async_mode=ASYNC_MODE)
+
+# gzip/brotli for JSON, HTML and text assets; content-hashed static URLs cached for a year
+compressor = ResponseCompressor()
+static_fingerprints = StaticFingerprints(app.static_folder)
+
+# Sampling profiler for slow-request diagnosis: PROFILE_SAMPLE_RATE of requests, or on demand with X-Profile
+profiler = Profiler()
 
 # Global dictionary to store user bots
 user_bots = {}
 
+# Per-session event logs: bots survive worker restarts and mistakes reach SQLite in batches
+event_logs = EventLogStore()
+event_logs.start(get_tracker())
+
+# Old mistakes and sessions are rolled up and archived in the background when RETENTION_INTERVAL is set
+retention = RetentionScheduler()
+retention.start(get_tracker())
+
+# Shared read-side analytics for dashboards (results are cached per user/language/window)
+analytics = MistakeAnalytics(get_tracker())
+
+def get_bot(session_id):
+    """Return the session's bot, rebuilding it from its event log if this worker doesn't have it"""
+    if not session_id:
+        return None
+    bot = user_bots.get(session_id)
+    if bot is not None and bot.event_log is not None and bot.event_log.closed:
+        # The session's log was compacted and removed after sitting idle: the session is over
+        user_bots.pop(session_id, None)
+        return None
+    if bot is not None:
+        bot.catch_up()
+        return bot
+    try:
+        if not event_logs.exists(session_id):
+            return None
+        bot = LanguageLearningBot.from_event_log(session_id, event_logs.open(session_id))
+    except Exception as e:
+        print(f"Error restoring session {session_id}: {str(e)}")
+        return None
+    if bot is not None:
+        user_bots[session_id] = bot
+    return bot
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for latency metrics"""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record per-route latency and status counts"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        registry.observe('http_request_duration_seconds', time.perf_counter() - start,
+                         'Latency of HTTP requests', route=route, method=request.method)
+        registry.inc('http_requests_total', 1, 'HTTP requests served',
+                     route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """Add a content hash to static URLs so they can be cached until the file changes"""
+    if endpoint == 'static' and 'v' not in values:
+        version = static_fingerprints.version(values.get('filename', ''))
+        if version:
+            values['v'] = version
+
+@app.after_request
+def cache_and_compress(response):
+    """Long-lived caching for fingerprinted static files, then compression"""
+    if request.endpoint == 'static' and request.args.get('v'):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return compressor.compress(request, response)
+
+def review_etag(session_id, bot):
+    """Version of a session's review: it only changes when new mistakes are recorded"""
+    state = f"{session_id}|{bot.learning_language}|{len(bot.mistakes)}"
+    return hashlib.blake2b(state.encode('utf-8'), digest_size=12).hexdigest()
+
+def profiled(name):
+    """Profile the view when the request asks for it (X-Profile: PROFILE_TOKEN) or is sampled"""
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not profiler.wants(request.headers.get('X-Profile')):
+                return view(*args, **kwargs)
+            with profiler.capture(name) as capture:
+                response = make_response(view(*args, **kwargs))
+            if profiler.save(capture):
+                registry.inc('profiles_captured_total', 1, 'Requests captured by the sampling profiler', request=name)
+                response.headers['X-Profile-Id'] = capture.profile_id
+            return response
+        return wrapper
+    return decorate
+
+def profiles_authorized():
+    """Admin profile endpoints need PROFILE_TOKEN as an X-Profile header (query strings end up in logs)"""
+    return profiler.authorized(request.headers.get('X-Profile'))
+
+def analytics_authorized(user_name, cohort):
+    """Teachers need ANALYTICS_TOKEN as an X-Analytics-Token header; a learner may only see their own dashboard"""
+    expected = os.getenv('ANALYTICS_TOKEN', '')
+    token = request.headers.get('X-Analytics-Token')
+    if expected and token and hmac.compare_digest(token, expected):
+        return True
+    bot = get_bot(session.get('session_id'))
+    return not cohort and bot is not None and bot.user_name == user_name
+
+@app.route('/metrics')
+def metrics():
+    """Expose collected metrics in Prometheus text format"""
+    return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Render the main page"""
@@ -38,6 +163,35 @@ def start_session():
     bot.native_language = data.get('native_language')
     bot.learning_language = data.get('learning_language')
     bot.selected_scene = data.get('scenario', 'restaurant')
+    bot.proficiency_level = data.get('proficiency_level', 'beginner')
+    bot.session_key = session_id
+    
+    # The database session row is updated by id as the conversation goes
+    bot.begin_db_session()
+    
+    # Everything needed to rebuild this bot goes to the session's event log
+    bot.event_log = event_logs.open(session_id)
+    bot.log_event(
+        "session",
+        user_name=bot.user_name,
+        native_language=bot.native_language,
+        learning_language=bot.learning_language,
+        proficiency_level=bot.proficiency_level,
+        selected_scene=bot.selected_scene,
+        db_session_id=bot.db_session_id
+    )
+    
+    # Load the learner's recurring mistakes so the tutor can target them, and the scene's vocabulary
+    bot.load_weakness_profile()
+    bot.load_vocab_pack()
+    
+    # Warm the conversation chain and get the opening turn going before the first message
+    bot.get_conversation_chain()
+    key = opener_key(bot)
+    bot.opening = opener_pool.take(key)
+    if bot.opening is None:
+        bot.opening_future = prefetch_executor.submit(bot.generate_opening)
+    opener_pool.refill(key, bot)
     
     # Store the bot in the global dictionary
     user_bots[session_id] = bot
@@ -51,6 +205,7 @@ def start_session():
     })
 
 @app.route('/api/send-message', methods=['POST'])
+@profiled('send_message')
 def send_message():
     """Process a user message and return the bot's response"""
     data = request.json
@@ -58,17 +213,30 @@ def send_message():
     user_input = data.get('message', '')
     
     # Check if session exists
-    if not session_id or session_id not in user_bots:
+    bot = get_bot(session_id)
+    if bot is None:
         return jsonify({
             'success': False,
             'message': 'Session not found or expired. Please start a new session.'
         }), 404
     
-    bot = user_bots[session_id]
-    
     try:
+        # The client's initial greeting is answered with the prefetched opening turn
+        if data.get('initial') and not bot.conversation_history:
+            # A slow prefetch falls back to answering the greeting with a direct call
+            opening = bot.take_opening(timeout=float(os.getenv('OPENING_WAIT_TIMEOUT', 10)))
+            if opening:
+                bot.add_turn("user", user_input)
+                bot.add_turn("assistant", opening)
+                return jsonify({
+                    'success': True,
+                    'response': opening,
+                    'mistakes': []
+                })
+        
         # Add to conversation history
-        bot.conversation_history.append({"role": "user", "content": user_input})
+        bot.add_turn("user", user_input)
+        bot.track_pack_vocabulary(user_input)
         
         # Check for mistakes
         mistakes = []
@@ -80,28 +248,19 @@ def send_message():
             except Exception as e:
                 print(f"Error checking mistakes: {str(e)}")
         
-        # Create conversation chain if it doesn't exist
-        if not hasattr(bot, 'conversation_chain'):
-            conversation_prompt = ChatPromptTemplate.from_messages([
-                ("system", bot.create_system_prompt()),
-                ("human", "{input}")
-            ])
-            
-            bot.conversation_chain = LLMChain(
-                llm=bot.llm,
-                prompt=conversation_prompt,
-                verbose=False
-            )
-        
         # Get full conversation history for context
-        full_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in bot.conversation_history])
+        full_history = bot.conversation_history.render()
         
         # Get response from the assistant
-        response = bot.conversation_chain.invoke({"input": user_input + "\n\nConversation history:\n" + full_history})
+        response = bot.run_chain(
+            bot.get_conversation_chain(),
+            {"input": user_input + "\n\nConversation history:\n" + full_history},
+            "conversation"
+        )
         bot_response = response["text"]
         
         # Add to conversation history
-        bot.conversation_history.append({"role": "assistant", "content": bot_response})
+        bot.add_turn("assistant", bot_response)
         
         return jsonify({
             'success': True,
@@ -109,6 +268,11 @@ def send_message():
             'mistakes': mistakes
         })
         
+    except TokenBudgetExceeded as e:
+        return jsonify({
+            'success': False,
+            'message': f'Token limit reached for this session: {str(e)}'
+        }), 429
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -118,18 +282,31 @@ def send_message():
         }), 500
 
 @app.route('/api/get-review', methods=['GET'])
+@profiled('get_review')
 def get_review():
     """Generate a review of the user's performance"""
     session_id = session.get('session_id')
     
     # Check if session exists
-    if not session_id or session_id not in user_bots:
+    bot = get_bot(session_id)
+    if bot is None:
         return jsonify({
             'status': 'error',
             'message': 'Session not found or expired. Please start a new session.'
         }), 404
     
-    bot = user_bots[session_id]
+    # An unchanged review is answered from the client's copy (304) or the bot's, without another LLM call
+    etag = review_etag(session_id, bot)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif bot.last_review is not None and bot.last_review[0] == etag:
+        response = jsonify(bot.last_review[1])
+    else:
+        response = None
+    if response is not None:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     
     try:
         if not bot.mistakes:
@@ -158,16 +335,17 @@ def get_review():
                 
                 Keep your response concise and practical.
                 """),
-                ("human", str(categories))
+                ("human", "{input}")
             ])
             
+            _, llm = bot.llm_for_task("suggestions", str(categories))
             suggestion_chain = LLMChain(
-                llm=bot.llm,
+                llm=llm,
                 prompt=suggestion_prompt,
                 verbose=False
             )
             
-            suggestions = suggestion_chain.invoke({"input": str(categories)})
+            suggestions = bot.run_chain(suggestion_chain, {"input": str(categories)}, "suggestions")
             
             review = {
                 'status': 'success',
@@ -177,8 +355,17 @@ def get_review():
                 'suggestions': suggestions["text"]
             }
         
-        return jsonify(review)
+        bot.last_review = (etag, review)
+        response = jsonify(review)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
         
+    except TokenBudgetExceeded as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Token limit reached for this session: {str(e)}'
+        }), 429
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -192,14 +379,23 @@ def end_session():
     """End the current session"""
     session_id = session.get('session_id')
     
-    if session_id and session_id in user_bots:
-        # Clean up resources
+    bot = get_bot(session_id)
+    if bot is not None:
+        # Final counters and end time of the session row
+        bot.finish_db_session()
+        # Write out buffered usage (the database manager is shared, so it stays open)
         try:
-            user_bots[session_id].db_manager.close()
-        except:
-            pass
+            bot.db_manager.flush_token_usage()
+        except Exception as e:
+            print(f"Error flushing token usage: {str(e)}")
+        # Move the session's logged mistakes into the database, then drop its log
+        try:
+            if event_logs.compact(session_id, bot.db_manager) is not None:
+                event_logs.remove(session_id)
+        except Exception as e:
+            print(f"Error compacting session log: {str(e)}")
         # Remove the bot instance
-        del user_bots[session_id]
+        user_bots.pop(session_id, None)
         session.pop('session_id', None)
     
     return jsonify({
@@ -207,6 +403,78 @@ def end_session():
         'message': 'Session ended successfully'
     })
 
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """Return mistake trends, category statistics and accuracy for a learner or cohort"""
+    language = request.args.get('language')
+    window = request.args.get('window', 84, type=int)
+    cohort = [name for name in request.args.get('cohort', '').split(',') if name]
+    user_name = request.args.get('user')
+    
+    if not user_name and not cohort:
+        return jsonify({
+            'status': 'error',
+            'message': 'Provide a user or a comma-separated cohort.'
+        }), 400
+    if not analytics_authorized(user_name, cohort):
+        return jsonify({'status': 'error', 'message': 'Not authorized.'}), 403
+    
+    try:
+        result = {'status': 'success'}
+        # NumPy and SQLite work would otherwise block every other greenlet in async mode
+        if user_name:
+            result['dashboard'] = run_blocking(analytics.dashboard, user_name, language, window)
+        if cohort:
+            result['cohort'] = run_blocking(analytics.cohort_comparison, cohort, language, window)
+        return jsonify(result)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'status': 'error',
+            'message': f'Error computing analytics: {str(e)}'
+        }), 500
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List captured profiles, newest first (optionally only one request name)"""
+    if not profiles_authorized():
+        return jsonify({'status': 'error', 'message': 'Not authorized.'}), 403
+    return jsonify({'status': 'success', 'profiles': profiler.store.list(request.args.get('name'))})
+
+@app.route('/admin/profiles/<profile_id>.folded', methods=['GET'])
+def get_profile(profile_id):
+    """Raw collapsed stacks, for flamegraph.pl, speedscope and similar tools"""
+    if not profiles_authorized():
+        return jsonify({'status': 'error', 'message': 'Not authorized.'}), 403
+    try:
+        with open(profiler.store.path_for(profile_id), encoding='utf-8') as f:
+            return Response(f.read(), mimetype='text/plain')
+    except (ValueError, FileNotFoundError):
+        return jsonify({'status': 'error', 'message': 'Profile not found.'}), 404
+
+@app.route('/admin/profiles/<profile_id>.svg', methods=['GET'])
+def get_profile_flamegraph(profile_id):
+    """Flame graph of one captured request"""
+    if not profiles_authorized():
+        return jsonify({'status': 'error', 'message': 'Not authorized.'}), 403
+    try:
+        counts = profiler.store.load(profile_id)
+    except (ValueError, FileNotFoundError):
+        return jsonify({'status': 'error', 'message': 'Profile not found.'}), 404
+    return Response(render_flamegraph(counts, profile_id), mimetype='image/svg+xml')
+
+@app.route('/admin/flamegraph.svg', methods=['GET'])
+def get_merged_flamegraph():
+    """Flame graph of the last `limit` profiles of a request name (e.g. name=send_message)"""
+    if not profiles_authorized():
+        return jsonify({'status': 'error', 'message': 'Not authorized.'}), 403
+    name = request.args.get('name')
+    profile_ids = profiler.store.list(name)[:request.args.get('limit', 50, type=int)]
+    counts = run_blocking(profiler.store.merge, profile_ids)
+    title = f"{name or 'all requests'}: last {len(profile_ids)} profiles"
+    return Response(render_flamegraph(counts, title), mimetype='image/svg+xml')
+
 if __name__ == '__main__':
     # Create the templates and static directories if they don't exist
     os.makedirs('templates', exist_ok=True)
@@ -0,0 +1,70 @@
+import os
+from dotenv import load_dotenv
+
+# Read .env before choosing the serving mode
+load_dotenv()
+
+# threading (default) or gevent
+ASYNC_MODE = os.getenv("ASYNC_MODE", "threading").lower()
+
+
+def monkey_patch():
+    """Make sockets, ssl, time.sleep and locks cooperative; must run before other imports"""
+    if ASYNC_MODE == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+    elif ASYNC_MODE != "threading":
+        raise ValueError(f"Unknown ASYNC_MODE: {ASYNC_MODE}")
+
+
+def run_blocking(func, *args, **kwargs):
+    """Run a CPU- or SQLite-bound call in a real OS thread so it doesn't stall the event loop"""
+    if ASYNC_MODE == "gevent":
+        import gevent
+        # Called from a pool thread (nested), gevent runs it immediately
+        return gevent.get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+def start_native_thread(func, *args):
+    """Start a real OS thread even when threading is monkey patched (e.g. to sample other greenlets)"""
+    if ASYNC_MODE == "gevent":
+        from gevent import monkey
+        return monkey.get_original("_thread", "start_new_thread")(func, args)
+    import _thread
+    return _thread.start_new_thread(func, args)
+
+
+def native_lock():
+    """A lock shared between a native thread and greenlets (a patched lock would need the hub)"""
+    if ASYNC_MODE == "gevent":
+        from gevent import monkey
+        return monkey.get_original("_thread", "allocate_lock")()
+    import _thread
+    return _thread.allocate_lock()
+
+
+def native_sleep(seconds):
+    """Block the calling OS thread; inside a native thread the patched time.sleep would need the hub"""
+    if ASYNC_MODE == "gevent":
+        from gevent import monkey
+        return monkey.get_original("time", "sleep")(seconds)
+    import time
+    return time.sleep(seconds)
+
+
+def native_thread_id():
+    """Identifier of the calling OS thread (the patched threading.get_ident returns a greenlet id)"""
+    if ASYNC_MODE == "gevent":
+        from gevent import monkey
+        return monkey.get_original("_thread", "get_ident")()
+    import _thread
+    return _thread.get_ident()
+
+
+def current_greenlet():
+    """The running greenlet in gevent mode, None with plain threads"""
+    if ASYNC_MODE == "gevent":
+        import greenlet
+        return greenlet.getcurrent()
+    return None
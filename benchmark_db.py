@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import subprocess
+from db_manager import MistakeTracker
+
+# Full-size defaults match production-like data volumes; use --scale to shrink them
+DEFAULT_USERS = 10000
+DEFAULT_MISTAKES = 10000000
+DEFAULT_VOCABULARY = 1000000
+DEFAULT_SESSIONS_PER_USER = 5
+
+LANGUAGES = ["Spanish", "French", "German", "Italian", "Japanese"]
+CATEGORIES = ["grammar", "vocabulary", "word order", "conjugation", "articles/gender", "register/formality"]
+SEED_BATCH = 50000
+
+
+def _batched(rows, size=SEED_BATCH):
+    """Yield lists of at most size rows from an iterator"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _remove_database(db_path):
+    for path in (db_path, db_path + "-wal", db_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _seeded_sizes(db_path):
+    """Sizes a database was completely seeded with, or None"""
+    if not os.path.exists(db_path):
+        return None
+    conn = sqlite3.connect(db_path)
+    try:
+        return json.loads(conn.execute("SELECT sizes FROM benchmark_seed").fetchone()[0])
+    except (sqlite3.Error, TypeError, ValueError):
+        return None
+    finally:
+        conn.close()
+
+
+def seed_database(db_path, users, mistakes, vocabulary, sessions_per_user, seed=42):
+    """Create a synthetic database with bulk inserts; a database seeded with exactly these sizes is reused"""
+    # weakness_profiles marks databases seeded with profiles; older seeds are rebuilt
+    sizes = {"users": users, "mistakes": mistakes, "vocabulary": vocabulary,
+             "sessions_per_user": sessions_per_user, "seed": seed, "weakness_profiles": True}
+    if _seeded_sizes(db_path) == sizes:
+        print(f"Reusing seeded database {db_path} ({users} users, {mistakes} mistakes)")
+        return
+    # Any other size (or an interrupted seed) starts from an empty file so sizes never drift
+    _remove_database(db_path)
+
+    tracker = MistakeTracker(db_path)
+    conn = tracker.conn
+    cursor = conn.cursor()
+    print(f"Seeding {db_path}: {users} users, {mistakes} mistakes, {vocabulary} vocabulary rows...")
+    rng = random.Random(seed)
+    start = time.perf_counter()
+
+    # Favour raw throughput while seeding; durability does not matter for synthetic data
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = OFF")
+
+    cursor.executemany("INSERT INTO users (name) VALUES (?)", ((f"user-{i}",) for i in range(users)))
+    cursor.executemany("INSERT OR IGNORE INTO languages (name) VALUES (?)", ((name,) for name in LANGUAGES))
+    cursor.executemany("INSERT OR IGNORE INTO mistake_categories (name) VALUES (?)", ((name,) for name in CATEGORIES))
+
+    text_ids = [tracker.intern_text(f"Synthetic explanation number {i} for benchmarking.") for i in range(500)]
+    conn.commit()
+    user_ids = [row[0] for row in cursor.execute("SELECT id FROM users ORDER BY id")]
+    category_names = dict(cursor.execute("SELECT id, name FROM mistake_categories"))
+    # Every add_mistake reads, merges and writes the learner's profile, so the seed has realistic ones
+    profiles = {}
+
+    def mistake_rows():
+        for _ in range(mistakes):
+            row = (
+                rng.choice(user_ids), rng.randint(1, len(LANGUAGES)),
+                "yo es", "yo soy", rng.randint(1, len(CATEGORIES)), rng.choice(text_ids),
+                f"-{rng.randint(0, 365)} days"
+            )
+            profile = profiles.setdefault((row[0], row[1]), {"total": 0, "categories": {}, "pairs": []})
+            tracker._apply_to_profile(profile, category_names.get(row[4]), row[2], row[3])
+            yield row
+
+    for batch in _batched(mistake_rows()):
+        cursor.executemany('''
+        INSERT INTO mistakes (user_id, language_id, mistake, correction, category_id, explanation_id, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))
+        ''', batch)
+        conn.commit()
+
+    for batch in _batched((user_id, language_id, json.dumps(profile, ensure_ascii=False))
+                          for (user_id, language_id), profile in profiles.items()):
+        cursor.executemany('''
+        INSERT OR REPLACE INTO weakness_profiles (user_id, language_id, profile) VALUES (?, ?, ?)
+        ''', batch)
+        conn.commit()
+
+    def vocabulary_rows():
+        for i in range(vocabulary):
+            yield (rng.choice(user_ids), rng.randint(1, len(LANGUAGES)), f"word-{i % 20000}", "translation", "context")
+
+    for batch in _batched(vocabulary_rows()):
+        cursor.executemany('''
+        INSERT INTO vocabulary_learned (user_id, language_id, word_or_phrase, translation, context)
+        VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+        conn.commit()
+
+    def session_rows():
+        for user_id in user_ids:
+            for _ in range(sessions_per_user):
+                yield (user_id, rng.randint(1, len(LANGUAGES)), "beginner", "at a restaurant",
+                       f"-{rng.randint(0, 365)} days", rng.random())
+
+    for batch in _batched(session_rows()):
+        cursor.executemany('''
+        INSERT INTO sessions (user_id, language_id, proficiency_level, scene, start_time, end_time, accuracy_rate)
+        VALUES (?, ?, ?, ?, datetime('now', ?), datetime('now'), ?)
+        ''', batch)
+        conn.commit()
+
+    cursor.execute("PRAGMA synchronous = FULL")
+    cursor.execute("ANALYZE")
+    # Written last: only a completely seeded database is ever reused
+    cursor.execute("CREATE TABLE benchmark_seed (sizes TEXT NOT NULL)")
+    cursor.execute("INSERT INTO benchmark_seed (sizes) VALUES (?)", (json.dumps(sizes, sort_keys=True),))
+    conn.commit()
+    tracker.close()
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+
+def working_copy(db_path):
+    """Copy the seeded database for one run, so write benchmarks never change the seeded data"""
+    run_path = db_path + ".run"
+    _remove_database(run_path)
+    source, destination = sqlite3.connect(db_path), sqlite3.connect(run_path)
+    try:
+        source.backup(destination)
+    finally:
+        source.close()
+        destination.close()
+    return run_path
+
+
+def _random_user(rng, users):
+    return f"user-{rng.randint(0, users - 1)}"
+
+
+def benchmark_operations(tracker, users, iterations, seed=7):
+    """Time each MistakeTracker operation and return latency/throughput statistics"""
+    rng = random.Random(seed)
+
+    operations = {
+        "add_mistake": lambda: tracker.add_mistake(
+            _random_user(rng, users), rng.choice(LANGUAGES), "la problema", "el problema",
+            "Greek-origin nouns ending in -ma are masculine.", rng.choice(CATEGORIES),
+            rule="Noun gender exceptions", examples=["El problema es grave."]
+        ),
+        "track_vocabulary": lambda: tracker.track_vocabulary(
+            _random_user(rng, users), rng.choice(LANGUAGES), f"word-{rng.randint(0, 19999)}", "translation", "context"
+        ),
+        "update_vocabulary_usage": lambda: tracker.update_vocabulary_usage(
+            _random_user(rng, users), rng.choice(LANGUAGES), f"word-{rng.randint(0, 19999)}"
+        ),
+        "get_user_mistakes": lambda: tracker.get_user_mistakes(_random_user(rng, users), rng.choice(LANGUAGES)),
+        "get_mistake_stats_by_category": lambda: tracker.get_mistake_stats_by_category(
+            _random_user(rng, users), rng.choice(LANGUAGES)
+        ),
+        "get_user_progress": lambda: tracker.get_user_progress(_random_user(rng, users), rng.choice(LANGUAGES)),
+    }
+
+    results = {}
+    for name, operation in operations.items():
+        # Warm up the page cache and statement cache before measuring
+        for _ in range(min(10, iterations)):
+            operation()
+
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            op_start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - op_start)
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        results[name] = {
+            "iterations": iterations,
+            "ops_per_second": round(iterations / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+            "p50_ms": round(pick(0.50) * 1000, 4),
+            "p95_ms": round(pick(0.95) * 1000, 4),
+            "p99_ms": round(pick(0.99) * 1000, 4),
+        }
+        print(f"{name:32s} {results[name]['ops_per_second']:>10} ops/s  "
+              f"p50 {results[name]['p50_ms']:.3f} ms  p99 {results[name]['p99_ms']:.3f} ms")
+    return results
+
+
+def _git_revision():
+    """Current git commit, so results can be tied to a version"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare_results(current, baseline, threshold):
+    """Print per-operation changes against a baseline and return the regressed operations"""
+    regressions = []
+    print(f"\nComparison with baseline {baseline.get('revision', '?')} (threshold {threshold:.0%}):")
+    for name, stats in current["operations"].items():
+        previous = baseline.get("operations", {}).get(name)
+        if not previous:
+            continue
+        change = (stats["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] if previous["p50_ms"] else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"{name:32s} p50 {previous['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms ({change:+.1%}) {flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MistakeTracker at realistic data sizes")
+    parser.add_argument("--db", default="benchmark.db", help="Database file to seed and benchmark")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the default data sizes (e.g. 0.01)")
+    parser.add_argument("--users", type=int, help=f"Number of users (default {DEFAULT_USERS})")
+    parser.add_argument("--mistakes", type=int, help=f"Number of mistakes (default {DEFAULT_MISTAKES})")
+    parser.add_argument("--vocabulary", type=int, help=f"Number of vocabulary rows (default {DEFAULT_VOCABULARY})")
+    parser.add_argument("--iterations", type=int, default=200, help="Measured calls per operation")
+    parser.add_argument("--results-dir", default="benchmark_results", help="Directory for JSON results")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 slowdown treated as a regression")
+    args = parser.parse_args()
+
+    users = args.users or max(1, int(DEFAULT_USERS * args.scale))
+    mistakes = args.mistakes or max(1, int(DEFAULT_MISTAKES * args.scale))
+    vocabulary = args.vocabulary or max(1, int(DEFAULT_VOCABULARY * args.scale))
+
+    seed_database(args.db, users, mistakes, vocabulary, DEFAULT_SESSIONS_PER_USER)
+    run_path = working_copy(args.db)
+    tracker = MistakeTracker(run_path)
+
+    results = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "sizes": {"users": users, "mistakes": mistakes, "vocabulary": vocabulary},
+        "operations": benchmark_operations(tracker, users, args.iterations),
+    }
+    tracker.close()
+    _remove_database(run_path)
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    output = os.path.join(args.results_dir, f"{results['timestamp'].replace(':', '')}-{results['revision']}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
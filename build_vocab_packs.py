@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import argparse
+from dotenv import load_dotenv
+from langchain.chains import LLMChain
+from langchain.prompts import ChatPromptTemplate
+from llm_backends import create_llm
+from language_learning_bot import SCENES, PROFICIENCY_LEVELS
+from vocab_packs import write_packs, VocabPacks
+
+GENERATION_PROMPT = """
+You are building offline study material for learners of {language} whose native language is {native_language}.
+Scenario: {scene}. Learner level: {level}.
+
+Return JSON only, in this format:
+{{
+    "vocabulary": [["word in {language}", "translation"]],
+    "phrases": [["useful phrase in {language}", "translation"]],
+    "common_mistakes": [
+        {{
+            "mistake": "incorrect phrase learners at this level often produce",
+            "correction": "corrected phrase",
+            "category": "grammar/vocabulary/etc.",
+            "explanation": "short explanation in {native_language}"
+        }}
+    ]
+}}
+
+Give about 40 words, 20 phrases and 15 common mistakes, most useful first.
+Only list mistakes that are wrong in every context, never phrases that can be correct.
+"""
+
+
+def _strip_fence(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+    return text
+
+
+def generate_pack(chain, language, native_language, scene, level):
+    """Ask the model for one pack's vocabulary, phrases and common mistakes"""
+    response = chain.invoke({
+        "language": language,
+        "native_language": native_language,
+        "scene": scene,
+        "level": level,
+    })
+    data = json.loads(_strip_fence(response["text"]))
+    return {
+        "language": language,
+        "native_language": native_language,
+        "scene": scene,
+        "level": level,
+        "vocabulary": [pair for pair in data.get("vocabulary", []) if len(pair) == 2],
+        "phrases": [pair for pair in data.get("phrases", []) if len(pair) == 2],
+        "common_mistakes": [m for m in data.get("common_mistakes", []) if m.get("mistake") and m.get("correction")],
+    }
+
+
+def generate_sources(languages, native_language, scenes, levels, existing):
+    """Generate the packs missing from existing (a list of source entries) with the LLM"""
+    prompt = ChatPromptTemplate.from_messages([("system", GENERATION_PROMPT), ("human", "Generate the pack.")])
+    chain = LLMChain(llm=create_llm(temperature=0.2), prompt=prompt, verbose=False)
+    have = {(entry["language"], entry["native_language"], entry["scene"], entry["level"]) for entry in existing}
+
+    sources = list(existing)
+    for language in languages:
+        for scene in scenes:
+            for level in levels:
+                if (language, native_language, scene, level) in have:
+                    continue
+                try:
+                    sources.append(generate_pack(chain, language, native_language, scene, level))
+                    print(f"Generated {language} / {scene} / {level}")
+                except Exception as e:
+                    print(f"Error generating {language} / {scene} / {level}: {str(e)}")
+    return sources
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Build the binary vocabulary packs (per language, scene and level) used by the bot"
+    )
+    parser.add_argument("--source", default="vocab_sources.json",
+                        help="Editable JSON list of packs; generated entries are added to it")
+    parser.add_argument("--output", default=os.getenv("VOCAB_PACK_PATH", "vocab_packs.bin"))
+    parser.add_argument("--generate", nargs="*", metavar="LANGUAGE",
+                        help="Generate missing packs for these languages with the LLM (e.g. Spanish French)")
+    parser.add_argument("--native-language", default="English", help="Language of translations and explanations")
+    args = parser.parse_args()
+
+    sources = []
+    if os.path.exists(args.source):
+        with open(args.source, encoding="utf-8") as f:
+            sources = json.load(f)
+        # Hand-written entries without a native language are in the one given on the command line
+        for entry in sources:
+            entry.setdefault("native_language", args.native_language)
+
+    if args.generate:
+        sources = generate_sources(args.generate, args.native_language, list(SCENES.values()),
+                                   PROFICIENCY_LEVELS, sources)
+        with open(args.source, "w", encoding="utf-8") as f:
+            json.dump(sources, f, ensure_ascii=False, indent=2)
+
+    if not sources:
+        print(f"No packs in {args.source}; use --generate LANGUAGE to create them")
+        return 1
+
+    write_packs(args.output, {
+        (entry["language"], entry["native_language"], entry["scene"], entry["level"]): entry for entry in sources
+    })
+    packs = VocabPacks(args.output)
+    print(f"Wrote {len(packs.packs)} packs to {args.output} ({os.path.getsize(args.output)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import zlib
+
+# One shared string object per role across every live session
+ROLES = {role: sys.intern(role) for role in ("user", "assistant", "system")}
+
+
+def _intern_role(role):
+    return ROLES.get(role) or sys.intern(role)
+
+
+class Turn:
+    """One turn: its role and content"""
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+
+
+class ConversationHistory:
+    """Compact conversation history with a lazily rendered prompt buffer"""
+
+    __slots__ = ("window", "_turns", "_rendered", "_pending", "_archive", "_archived_count")
+
+    def __init__(self, window=None):
+        # With a window, only the most recent turns are rendered; older ones are kept compressed
+        self.window = window if window is not None else int(os.getenv("HISTORY_WINDOW_TURNS", 0))
+        self._turns = []
+        # Rendered text up to the last render() plus the "role: content" chunks added since
+        self._rendered = ""
+        self._pending = []
+        # (turn count, compressed turns) blocks, oldest first
+        self._archive = []
+        self._archived_count = 0
+
+    def add(self, role, content):
+        """Append a turn; the rendered buffer is only extended on the next render()"""
+        role = _intern_role(role)
+        separator = "\n" if self._rendered or self._pending else ""
+        self._pending.append(f"{separator}{role}: {content}")
+        self._turns.append(Turn(role, content))
+
+        if self.window and len(self._turns) >= 2 * self.window:
+            self._archive_oldest(len(self._turns) - self.window)
+
+    def append(self, message):
+        """Append a {"role": ..., "content": ...} message (list-style compatibility)"""
+        self.add(message["role"], message["content"])
+
+    def render(self):
+        """The history as "role: content" lines, as sent to the model"""
+        if self._pending:
+            # One copy per render, however many turns were added since the last one
+            self._pending.insert(0, self._rendered)
+            self._rendered = "".join(self._pending)
+            self._pending = []
+        return self._rendered
+
+    def _archive_oldest(self, count):
+        """Compress the oldest live turns out of the rendered buffer (amortized O(1) per turn)"""
+        evicted = [(turn.role, turn.content) for turn in self._turns[:count]]
+        self._archive.append((count, zlib.compress(json.dumps(evicted, ensure_ascii=False).encode("utf-8"))))
+        self._archived_count += count
+
+        self._turns = self._turns[count:]
+        self._rendered = ""
+        self._pending = []
+        for turn in self._turns:
+            separator = "\n" if self._pending else ""
+            self._pending.append(f"{separator}{turn.role}: {turn.content}")
+
+    def _archived_turns(self, blob):
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    def __len__(self):
+        return self._archived_count + len(self._turns)
+
+    def __iter__(self):
+        """Yield every turn, archived ones first, as {"role": ..., "content": ...} dicts"""
+        for _, blob in self._archive:
+            for role, content in self._archived_turns(blob):
+                yield {"role": role, "content": content}
+        for turn in self._turns:
+            yield {"role": turn.role, "content": turn.content}
+
+    def __getitem__(self, index):
+        """Access any turn by index, archived ones first (negative indexes count from the newest turn)"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("conversation history index out of range")
+        if index >= self._archived_count:
+            turn = self._turns[index - self._archived_count]
+            return {"role": turn.role, "content": turn.content}
+        for count, blob in self._archive:
+            if index < count:
+                role, content = self._archived_turns(blob)[index]
+                return {"role": role, "content": content}
+            index -= count
@@ -1,12 +1,44 @@
 import sqlite3
 import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from metrics import instrument_methods
 
+# Columns of the mistakes table whose text is deduplicated into text_content
+INTERNED_MISTAKE_FIELDS = ("explanation", "rule", "examples", "common_pitfalls")
+
+# Number of distinct mistake -> correction pairs kept in a weakness profile
+WEAKNESS_PROFILE_MAX_PAIRS = 50
+
+# Number of buffered token usage records written per batch
+TOKEN_USAGE_BATCH_SIZE = 25
+
+# Number of sessions with pending counter updates written per batch
+SESSION_STATS_BATCH_SIZE = 25
+
+@instrument_methods("db_call_duration_seconds", "Latency of MistakeTracker calls")
 class MistakeTracker:
-    def __init__(self, db_name):
+    def __init__(self, db_name, check_same_thread=True):
         """Initialize the database connection and create tables if they don't exist"""
         self.db_name = db_name
-        self.conn = sqlite3.connect(db_name)
+        self.conn = sqlite3.connect(db_name, check_same_thread=check_same_thread)
+        # New databases give space freed by retention back incrementally (no effect on existing files)
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # digest -> text_content id, so repeated explanations cost no database round trip
+        self._text_ids = OrderedDict()
+        self._text_cache_size = 10000
+        # Digests cached during the open transaction; forgotten again if it is rolled back
+        self._uncommitted_texts = []
+        # Token usage records waiting for a batched insert (a tracker may be shared with background threads)
+        self._token_usage_buffer = []
+        self._token_usage_lock = threading.Lock()
+        # Latest counters per session id; repeated updates of a session coalesce until the next flush
+        self._session_stats_buffer = {}
+        # Called with (user_name, language_name) once new mistakes are committed, e.g. to drop cached analytics
+        self.mistake_listeners = []
         self.create_tables()
     
     def create_tables(self):
@@ -51,13 +83,86 @@ class MistakeTracker:
             category_id INTEGER,
             examples TEXT,
             common_pitfalls TEXT,
+            explanation_id INTEGER,
+            rule_id INTEGER,
+            examples_id INTEGER,
+            common_pitfalls_id INTEGER,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id),
             FOREIGN KEY (language_id) REFERENCES languages (id),
-            FOREIGN KEY (category_id) REFERENCES mistake_categories (id)
+            FOREIGN KEY (category_id) REFERENCES mistake_categories (id),
+            FOREIGN KEY (explanation_id) REFERENCES text_content (id),
+            FOREIGN KEY (rule_id) REFERENCES text_content (id),
+            FOREIGN KEY (examples_id) REFERENCES text_content (id),
+            FOREIGN KEY (common_pitfalls_id) REFERENCES text_content (id)
+        )
+        ''')
+        
+        # Create content-addressed text table shared by all mistake rows
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS text_content (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash BLOB NOT NULL UNIQUE,
+            content TEXT NOT NULL
         )
         ''')
         
+        # Create per-learner weakness profiles, maintained incrementally by add_mistake
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weakness_profiles (
+            user_id INTEGER NOT NULL,
+            language_id INTEGER NOT NULL,
+            profile TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, language_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (language_id) REFERENCES languages (id)
+        )
+        ''')
+        
+        # Create token usage table for per-call LLM accounting
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS token_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_key TEXT,
+            model TEXT,
+            task TEXT,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            cost REAL DEFAULT 0.0,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_token_usage_session ON token_usage (session_key)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_token_usage_user ON token_usage (user_id)")
+        
+        # How far each session's event log has been compacted, committed together with its rows
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_log_checkpoints (
+            session_key TEXT PRIMARY KEY,
+            user_id INTEGER,
+            log_offset INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''')
+        
+        # Progress of batch jobs (grade_corpus.py), committed together with each batch's rows
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job_key TEXT PRIMARY KEY,
+            next_index INTEGER NOT NULL
+        )
+        ''')
+        
+        # Databases created before text interning lack the reference columns
+        cursor.execute("PRAGMA table_info(mistakes)")
+        existing_columns = {row[1] for row in cursor.fetchall()}
+        for field in INTERNED_MISTAKE_FIELDS:
+            if f"{field}_id" not in existing_columns:
+                cursor.execute(f"ALTER TABLE mistakes ADD COLUMN {field}_id INTEGER REFERENCES text_content (id)")
+        
         # Create sessions table with enhanced tracking
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS sessions (
@@ -115,8 +220,104 @@ class MistakeTracker:
         )
         ''')
         
+        # Per-user indexes: every query and shard move is scoped to one learner
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mistakes_user_language ON mistakes (user_id, language_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_language ON sessions (user_id, language_id)")
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_vocabulary_user_language_word
+        ON vocabulary_learned (user_id, language_id, word_or_phrase)
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_progress_user ON progress_tracking (user_id)")
+        
+        # Retention scans old rows by time
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mistakes_timestamp ON mistakes (timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON sessions (start_time)")
+        
+        # Monthly rollups of rows moved to the archive by retention.py
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mistake_monthly_summary (
+            user_id INTEGER NOT NULL,
+            language_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            mistake_count INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, language_id, category_id, month),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (language_id) REFERENCES languages (id),
+            FOREIGN KEY (category_id) REFERENCES mistake_categories (id)
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS session_monthly_summary (
+            user_id INTEGER NOT NULL,
+            language_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            session_count INTEGER DEFAULT 0,
+            total_interactions INTEGER DEFAULT 0,
+            mistake_count INTEGER DEFAULT 0,
+            vocabulary_learned INTEGER DEFAULT 0,
+            accuracy_sum REAL DEFAULT 0.0,
+            PRIMARY KEY (user_id, language_id, month),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (language_id) REFERENCES languages (id)
+        )
+        ''')
+        
+        # One row per learner name; older databases may hold duplicates created by concurrent first requests
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_users_name_unique'")
+        if cursor.fetchone() is None:
+            self._merge_duplicate_users(cursor)
+            cursor.execute("DROP INDEX IF EXISTS idx_users_name")
+            cursor.execute("CREATE UNIQUE INDEX idx_users_name_unique ON users (name)")
+        
         self.conn.commit()
     
+    def _merge_duplicate_users(self, cursor):
+        """Move the rows of duplicate users to the oldest user of the same name and delete the duplicates"""
+        cursor.execute("SELECT name, MIN(id), GROUP_CONCAT(id) FROM users GROUP BY name HAVING COUNT(*) > 1")
+        for name, keep_id, ids in cursor.fetchall():
+            duplicate_ids = [int(user_id) for user_id in ids.split(",") if int(user_id) != keep_id]
+            marks = ",".join("?" * len(duplicate_ids))
+            for table in ("mistakes", "sessions", "vocabulary_learned", "progress_tracking", "token_usage",
+                          "event_log_checkpoints"):
+                cursor.execute(f"UPDATE {table} SET user_id = ? WHERE user_id IN ({marks})", [keep_id] + duplicate_ids)
+            
+            # Summaries are keyed by user, so counts are added to the kept user's rows
+            cursor.execute(f'''
+            INSERT INTO mistake_monthly_summary (user_id, language_id, category_id, month, mistake_count)
+            SELECT ?, language_id, category_id, month, mistake_count
+            FROM mistake_monthly_summary WHERE user_id IN ({marks})
+            ON CONFLICT (user_id, language_id, category_id, month)
+            DO UPDATE SET mistake_count = mistake_count + excluded.mistake_count
+            ''', [keep_id] + duplicate_ids)
+            cursor.execute(f'''
+            INSERT INTO session_monthly_summary (user_id, language_id, month, session_count,
+                                                 total_interactions, mistake_count, vocabulary_learned, accuracy_sum)
+            SELECT ?, language_id, month, session_count, total_interactions, mistake_count, vocabulary_learned, accuracy_sum
+            FROM session_monthly_summary WHERE user_id IN ({marks})
+            ON CONFLICT (user_id, language_id, month) DO UPDATE SET
+                session_count = session_count + excluded.session_count,
+                total_interactions = total_interactions + excluded.total_interactions,
+                mistake_count = mistake_count + excluded.mistake_count,
+                vocabulary_learned = vocabulary_learned + excluded.vocabulary_learned,
+                accuracy_sum = accuracy_sum + excluded.accuracy_sum
+            ''', [keep_id] + duplicate_ids)
+            for table in ("mistake_monthly_summary", "session_monthly_summary"):
+                cursor.execute(f"DELETE FROM {table} WHERE user_id IN ({marks})", duplicate_ids)
+            
+            # Weakness profiles are rebuilt from the merged mistake history
+            cursor.execute(
+                f"SELECT DISTINCT language_id FROM weakness_profiles WHERE user_id IN (?, {marks})",
+                [keep_id] + duplicate_ids
+            )
+            language_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f"DELETE FROM weakness_profiles WHERE user_id IN ({marks})", duplicate_ids)
+            for language_id in language_ids:
+                self._rebuild_profile(keep_id, language_id)
+            
+            cursor.execute(f"DELETE FROM users WHERE id IN ({marks})", duplicate_ids)
+            print(f"Merged {len(duplicate_ids)} duplicate user rows of {name}")
+    
     def get_or_create_user(self, name):
         """Get a user ID or create if not exists"""
         cursor = self.conn.cursor()
@@ -128,11 +329,12 @@ class MistakeTracker:
         if user:
             return user[0]
         
-        # Create new user
-        cursor.execute("INSERT INTO users (name) VALUES (?)", (name,))
+        # Create new user (another pooled connection may have just created it)
+        cursor.execute("INSERT OR IGNORE INTO users (name) VALUES (?)", (name,))
         self.conn.commit()
         
-        return cursor.lastrowid
+        cursor.execute("SELECT id FROM users WHERE name = ?", (name,))
+        return cursor.fetchone()[0]
     
     def get_or_create_language(self, language_name):
         """Get a language ID or create if not exists"""
@@ -145,11 +347,12 @@ class MistakeTracker:
         if language:
             return language[0]
         
-        # Create new language
-        cursor.execute("INSERT INTO languages (name) VALUES (?)", (language_name,))
+        # Create new language (another pooled connection may have just created it)
+        cursor.execute("INSERT OR IGNORE INTO languages (name) VALUES (?)", (language_name,))
         self.conn.commit()
         
-        return cursor.lastrowid
+        cursor.execute("SELECT id FROM languages WHERE name = ?", (language_name,))
+        return cursor.fetchone()[0]
     
     def get_or_create_category(self, category_name):
         """Get a category ID or create if not exists"""
@@ -162,26 +365,300 @@ class MistakeTracker:
         if category:
             return category[0]
         
-        # Create new category
-        cursor.execute("INSERT INTO mistake_categories (name) VALUES (?)", (category_name,))
+        # Create new category (another pooled connection may have just created it)
+        cursor.execute("INSERT OR IGNORE INTO mistake_categories (name) VALUES (?)", (category_name,))
         self.conn.commit()
         
-        return cursor.lastrowid
+        cursor.execute("SELECT id FROM mistake_categories WHERE name = ?", (category_name,))
+        return cursor.fetchone()[0]
+    
+    def intern_text(self, text):
+        """Get the text_content ID for a piece of text, storing it once if new"""
+        if text is None:
+            return None
+        if not isinstance(text, str):
+            text = json.dumps(text, ensure_ascii=False)
+        if not text.strip():
+            return None
+        
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        text_id = self._text_ids.get(digest)
+        if text_id is not None:
+            self._text_ids.move_to_end(digest)
+            return text_id
+        
+        if not self.conn.in_transaction:
+            self._uncommitted_texts = []
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT OR IGNORE INTO text_content (hash, content) VALUES (?, ?)", (digest, text))
+        if cursor.rowcount:
+            text_id = cursor.lastrowid
+        else:
+            cursor.execute("SELECT id FROM text_content WHERE hash = ?", (digest,))
+            text_id = cursor.fetchone()[0]
+        
+        self._text_ids[digest] = text_id
+        self._uncommitted_texts.append(digest)
+        if len(self._text_ids) > self._text_cache_size:
+            self._text_ids.popitem(last=False)
+        return text_id
+    
+    def rollback(self):
+        """Roll back the open transaction and forget text ids cached during it (they point to no row)"""
+        self.conn.rollback()
+        for digest in self._uncommitted_texts:
+            self._text_ids.pop(digest, None)
+        self._uncommitted_texts = []
     
-    def add_mistake(self, user_name, language_name, mistake, correction, explanation, category_name):
-        """Add a mistake to the database"""
+    def add_mistake(self, user_name, language_name, mistake, correction, explanation, category_name,
+                    rule=None, examples=None, common_pitfalls=None):
+        """Add a mistake to the database, deduplicating its explanatory text"""
         user_id = self.get_or_create_user(user_name)
         language_id = self.get_or_create_language(language_name)
         category_id = self.get_or_create_category(category_name)
         
+        try:
+            explanation_id = self.intern_text(explanation)
+            rule_id = self.intern_text(rule)
+            examples_id = self.intern_text(examples)
+            common_pitfalls_id = self.intern_text(common_pitfalls)
+            
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            INSERT INTO mistakes (user_id, language_id, mistake, correction, category_id,
+                                  explanation_id, rule_id, examples_id, common_pitfalls_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, language_id, mistake, correction, category_id,
+                  explanation_id, rule_id, examples_id, common_pitfalls_id))
+            
+            self._update_weakness_profile(user_id, language_id, category_name, mistake, correction)
+            
+            self.conn.commit()
+        except Exception:
+            self.rollback()
+            raise
+        self._notify_mistakes({(user_name, language_name)})
+    
+    def add_mistakes(self, rows):
+        """Add many mistakes in one transaction
+
+        rows are (user_name, language_name, mistake, correction, explanation, category_name,
+        rule, examples, common_pitfalls) tuples; each learner's weakness profile is updated once.
+        """
+        try:
+            learners = self._insert_mistakes(rows)
+            self.conn.commit()
+        except Exception:
+            self.rollback()
+            raise
+        self._notify_mistakes(learners)
+    
+    def _insert_mistakes(self, rows):
+        """Insert add_mistakes rows without committing; returns the (user, language) pairs written"""
+        ids = {}
+        
+        def cached(method, name):
+            if (method, name) not in ids:
+                ids[(method, name)] = method(name)
+            return ids[(method, name)]
+        
+        inserts = []
+        profiles = {}
+        learners = set()
+        for (user_name, language_name, mistake, correction, explanation, category_name,
+             rule, examples, common_pitfalls) in rows:
+            user_id = cached(self.get_or_create_user, user_name)
+            language_id = cached(self.get_or_create_language, language_name)
+            inserts.append((
+                user_id, language_id, mistake, correction,
+                cached(self.get_or_create_category, category_name),
+                self.intern_text(explanation), self.intern_text(rule),
+                self.intern_text(examples), self.intern_text(common_pitfalls)
+            ))
+            profiles.setdefault((user_id, language_id), []).append((category_name, mistake, correction))
+            learners.add((user_name, language_name))
+        
+        if not inserts:
+            return learners
+        
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+        INSERT INTO mistakes (user_id, language_id, mistake, correction, category_id,
+                              explanation_id, rule_id, examples_id, common_pitfalls_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', inserts)
+        
+        for (user_id, language_id), mistakes in profiles.items():
+            profile = self._load_profile(user_id, language_id)
+            for category_name, mistake, correction in mistakes:
+                self._apply_to_profile(profile, category_name, mistake, correction)
+            self._store_profile(user_id, language_id, profile)
+        return learners
+    
+    def get_event_log_offset(self, user_name, session_key):
+        """Byte offset up to which a session's event log has been written to the database, or None"""
         cursor = self.conn.cursor()
         cursor.execute('''
-        INSERT INTO mistakes (user_id, language_id, mistake, correction, explanation, category_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, language_id, mistake, correction, explanation, category_id))
+        SELECT c.log_offset FROM event_log_checkpoints c
+        JOIN users u ON u.id = c.user_id
+        WHERE c.session_key = ? AND u.name = ?
+        ''', (session_key, user_name))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def add_logged_events(self, user_name, language_name, session_key, start_offset, end_offset,
+                          mistakes, vocabulary):
+        """Write a session's logged mistakes and vocabulary and move its checkpoint in one transaction
+
+        mistakes are add_mistakes rows without the user and language names; vocabulary rows are
+        (word, translation, context). Returns False without writing anything when the checkpoint
+        is no longer at start_offset (the events were already written).
+        """
+        if self.get_event_log_offset(user_name, session_key) not in (None, start_offset):
+            return False
         
+        user_id = self.get_or_create_user(user_name)
+        language_id = self.get_or_create_language(language_name)
+        try:
+            learners = self._insert_mistakes([(user_name, language_name) + tuple(row) for row in mistakes])
+            cursor = self.conn.cursor()
+            cursor.executemany('''
+            INSERT INTO vocabulary_learned (user_id, language_id, word_or_phrase, translation, context)
+            VALUES (?, ?, ?, ?, ?)
+            ''', [(user_id, language_id) + tuple(row) for row in vocabulary])
+            cursor.execute('''
+            INSERT INTO event_log_checkpoints (session_key, user_id, log_offset) VALUES (?, ?, ?)
+            ON CONFLICT (session_key) DO UPDATE SET log_offset = excluded.log_offset
+            ''', (session_key, user_id, end_offset))
+            self.conn.commit()
+        except Exception:
+            self.rollback()
+            raise
+        self._notify_mistakes(learners)
+        return True
+    
+    def add_job_mistakes(self, job_key, next_index, rows):
+        """Add a batch job's mistakes (add_mistakes rows) and record its progress in one transaction
+
+        Returns False without writing anything when this database already holds the batch ending at
+        next_index, e.g. when a job is resumed after an interruption between the database and its checkpoint.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT next_index FROM job_checkpoints WHERE job_key = ?", (job_key,))
+        row = cursor.fetchone()
+        if row is not None and row[0] >= next_index:
+            return False
+        
+        try:
+            learners = self._insert_mistakes(rows)
+            cursor.execute('''
+            INSERT INTO job_checkpoints (job_key, next_index) VALUES (?, ?)
+            ON CONFLICT (job_key) DO UPDATE SET next_index = excluded.next_index
+            ''', (job_key, next_index))
+            self.conn.commit()
+        except Exception:
+            self.rollback()
+            raise
+        self._notify_mistakes(learners)
+        return True
+    
+    def _notify_mistakes(self, learners):
+        """Tell listeners which (user, language) pairs have new mistakes"""
+        for user_name, language_name in learners:
+            for listener in self.mistake_listeners:
+                listener(user_name, language_name)
+    
+    def _load_profile(self, user_id, language_id):
+        """Load the stored weakness profile for a user/language pair by primary key"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT profile FROM weakness_profiles WHERE user_id = ? AND language_id = ?",
+            (user_id, language_id)
+        )
+        row = cursor.fetchone()
+        if row:
+            return json.loads(row[0])
+        return {"total": 0, "categories": {}, "pairs": []}
+    
+    def _store_profile(self, user_id, language_id, profile):
+        """Write a weakness profile back (the caller commits)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+        INSERT OR REPLACE INTO weakness_profiles (user_id, language_id, profile, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (user_id, language_id, json.dumps(profile, ensure_ascii=False)))
+    
+    def _apply_to_profile(self, profile, category_name, mistake, correction):
+        """Fold one mistake into a profile's category counts and frequent pairs"""
+        profile["total"] += 1
+        category = category_name or "Uncategorized"
+        profile["categories"][category] = profile["categories"].get(category, 0) + 1
+        
+        pairs = profile["pairs"]
+        for pair in pairs:
+            if pair[0] == mistake and pair[1] == correction:
+                pair[2] += 1
+                pair[3] = profile["total"]
+                break
+        else:
+            if len(pairs) >= WEAKNESS_PROFILE_MAX_PAIRS:
+                # Evict the least frequent, least recently seen pair
+                pairs.remove(min(pairs, key=lambda p: (p[2], p[3])))
+            pairs.append([mistake, correction, 1, profile["total"]])
+    
+    def _update_weakness_profile(self, user_id, language_id, category_name, mistake, correction):
+        """Incrementally update the learner's weakness profile with a new mistake"""
+        profile = self._load_profile(user_id, language_id)
+        self._apply_to_profile(profile, category_name, mistake, correction)
+        self._store_profile(user_id, language_id, profile)
+    
+    def get_weakness_profile(self, user_name, language_name, top_categories=3, top_pairs=5):
+        """Get a learner's top mistake categories and frequent mistake -> correction pairs"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+        SELECT wp.profile
+        FROM weakness_profiles wp
+        JOIN users u ON wp.user_id = u.id
+        JOIN languages l ON wp.language_id = l.id
+        WHERE u.name = ? AND l.name = ?
+        ''', (user_name, language_name))
+        row = cursor.fetchone()
+        
+        if not row:
+            return None
+        
+        profile = json.loads(row[0])
+        categories = sorted(profile["categories"].items(), key=lambda item: item[1], reverse=True)
+        pairs = sorted(profile["pairs"], key=lambda p: (p[2], p[3]), reverse=True)
+        return {
+            "total_mistakes": profile["total"],
+            "top_categories": categories[:top_categories],
+            "frequent_pairs": [(p[0], p[1], p[2]) for p in pairs[:top_pairs]]
+        }
+    
+    def rebuild_weakness_profile(self, user_name, language_name):
+        """Rebuild a weakness profile from the full mistake history (for backfilling old data)"""
+        user_id = self.get_or_create_user(user_name)
+        language_id = self.get_or_create_language(language_name)
+        self._rebuild_profile(user_id, language_id)
         self.conn.commit()
     
+    def _rebuild_profile(self, user_id, language_id):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+        SELECT m.mistake, m.correction, mc.name
+        FROM mistakes m
+        LEFT JOIN mistake_categories mc ON m.category_id = mc.id
+        WHERE m.user_id = ? AND m.language_id = ?
+        ORDER BY m.id
+        ''', (user_id, language_id))
+        
+        profile = {"total": 0, "categories": {}, "pairs": []}
+        for mistake, correction, category_name in cursor.fetchall():
+            self._apply_to_profile(profile, category_name, mistake, correction)
+        
+        self._store_profile(user_id, language_id, profile)
+    
     def start_session(self, user_name, language_name, proficiency_level, scene):
         """Start a new learning session"""
         user_id = self.get_or_create_user(user_name)
@@ -196,14 +673,46 @@ class MistakeTracker:
         self.conn.commit()
         return cursor.lastrowid
     
-    def end_session(self, session_id, mistake_count):
-        """End a learning session and update statistics"""
+    def end_session(self, session_id, mistake_count, total_interactions=None, vocab_count=None,
+                    streak=None, accuracy_rate=None):
+        """End a learning session and write its final statistics"""
+        self._session_stats_buffer.pop(session_id, None)
+        
         cursor = self.conn.cursor()
         cursor.execute('''
         UPDATE sessions 
-        SET end_time = CURRENT_TIMESTAMP, mistake_count = ?
+        SET end_time = CURRENT_TIMESTAMP,
+            mistake_count = ?,
+            total_interactions = COALESCE(?, total_interactions),
+            vocabulary_learned = COALESCE(?, vocabulary_learned),
+            learning_streak = COALESCE(?, learning_streak),
+            accuracy_rate = COALESCE(?, accuracy_rate)
         WHERE id = ?
-        ''', (mistake_count, session_id))
+        ''', (mistake_count, total_interactions, vocab_count, streak, accuracy_rate, session_id))
+        
+        self.conn.commit()
+    
+    def record_session_stats(self, session_id, total_interactions, mistake_count, vocab_count, streak, accuracy_rate):
+        """Buffer a session's running counters; sessions are updated by id in batches"""
+        self._session_stats_buffer[session_id] = (
+            total_interactions, mistake_count, vocab_count, streak, accuracy_rate
+        )
+        if len(self._session_stats_buffer) >= SESSION_STATS_BATCH_SIZE:
+            self.flush_session_stats()
+    
+    def flush_session_stats(self):
+        """Write all buffered session counters in a single transaction"""
+        if not self._session_stats_buffer:
+            return
+        
+        buffered, self._session_stats_buffer = self._session_stats_buffer, {}
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+        UPDATE sessions
+        SET total_interactions = ?, mistake_count = ?, vocabulary_learned = ?,
+            learning_streak = ?, accuracy_rate = ?
+        WHERE id = ? AND end_time IS NULL
+        ''', [stats + (session_id,) for session_id, stats in buffered.items()])
         
         self.conn.commit()
     
@@ -212,11 +721,13 @@ class MistakeTracker:
         cursor = self.conn.cursor()
         
         query = '''
-        SELECT m.mistake, m.correction, m.explanation, mc.name as category, m.timestamp
+        SELECT m.mistake, m.correction, COALESCE(te.content, m.explanation) as explanation,
+               mc.name as category, m.timestamp
         FROM mistakes m
         JOIN users u ON m.user_id = u.id
         JOIN languages l ON m.language_id = l.id
         JOIN mistake_categories mc ON m.category_id = mc.id
+        LEFT JOIN text_content te ON m.explanation_id = te.id
         WHERE u.name = ?
         '''
         
@@ -232,6 +743,56 @@ class MistakeTracker:
         cursor.execute(query, params)
         return cursor.fetchall()
     
+    def get_user_mistake_details(self, user_name, language_name=None, limit=100):
+        """Get user's mistakes with the full structured analysis as dictionaries"""
+        cursor = self.conn.cursor()
+        
+        query = '''
+        SELECT m.mistake, m.correction, mc.name,
+               COALESCE(te.content, m.explanation), COALESCE(tr.content, m.rule),
+               COALESCE(tx.content, m.examples), COALESCE(tp.content, m.common_pitfalls),
+               m.timestamp
+        FROM mistakes m
+        JOIN users u ON m.user_id = u.id
+        JOIN languages l ON m.language_id = l.id
+        JOIN mistake_categories mc ON m.category_id = mc.id
+        LEFT JOIN text_content te ON m.explanation_id = te.id
+        LEFT JOIN text_content tr ON m.rule_id = tr.id
+        LEFT JOIN text_content tx ON m.examples_id = tx.id
+        LEFT JOIN text_content tp ON m.common_pitfalls_id = tp.id
+        WHERE u.name = ?
+        '''
+        
+        params = [user_name]
+        
+        if language_name:
+            query += " AND l.name = ?"
+            params.append(language_name)
+        
+        query += " ORDER BY m.timestamp DESC LIMIT ?"
+        params.append(limit)
+        
+        cursor.execute(query, params)
+        
+        details = []
+        for mistake, correction, category, explanation, rule, examples, pitfalls, timestamp in cursor.fetchall():
+            try:
+                examples = json.loads(examples) if examples else []
+            except ValueError:
+                # Older rows may hold plain text examples
+                examples = [examples]
+            details.append({
+                "mistake": mistake,
+                "correction": correction,
+                "category": category,
+                "explanation": explanation,
+                "rule": rule,
+                "examples": examples,
+                "common_pitfalls": pitfalls,
+                "timestamp": timestamp
+            })
+        return details
+    
     def get_mistake_stats_by_category(self, user_name, language_name=None):
         """Get statistics about mistakes grouped by category"""
         cursor = self.conn.cursor()
@@ -256,30 +817,181 @@ class MistakeTracker:
         cursor.execute(query, params)
         return cursor.fetchall()
     
+    def get_monthly_mistake_counts(self, user_name, language_name=None):
+        """Mistake counts per (month, category) over the learner's whole history, archived months included"""
+        cursor = self.conn.cursor()
+        
+        params = [user_name]
+        language_filter = ""
+        if language_name:
+            language_filter = " AND l.name = ?"
+            params.append(language_name)
+        
+        cursor.execute(f'''
+        SELECT month, category, SUM(count) FROM (
+            SELECT s.month AS month, mc.name AS category, s.mistake_count AS count
+            FROM mistake_monthly_summary s
+            JOIN users u ON s.user_id = u.id
+            JOIN languages l ON s.language_id = l.id
+            JOIN mistake_categories mc ON s.category_id = mc.id
+            WHERE u.name = ?{language_filter}
+            UNION ALL
+            SELECT strftime('%Y-%m', m.timestamp), mc.name, COUNT(*)
+            FROM mistakes m
+            JOIN users u ON m.user_id = u.id
+            JOIN languages l ON m.language_id = l.id
+            JOIN mistake_categories mc ON m.category_id = mc.id
+            WHERE u.name = ?{language_filter}
+            GROUP BY strftime('%Y-%m', m.timestamp), mc.name
+        )
+        GROUP BY month, category
+        ORDER BY month, category
+        ''', params + params)
+        return cursor.fetchall()
+    
+    def _user_filter(self, user_names, params):
+        """Build a user-name filter clause for bulk queries"""
+        if not user_names:
+            return ""
+        params.extend(user_names)
+        return " AND u.name IN (%s)" % ",".join("?" * len(user_names))
+    
+    def fetch_mistake_rows(self, user_names=None, language_name=None, since=None):
+        """Fetch (user, category, unix timestamp) rows in bulk for analytics"""
+        cursor = self.conn.cursor()
+        
+        query = '''
+        SELECT u.name, mc.name, CAST(strftime('%s', m.timestamp) AS INTEGER)
+        FROM mistakes m
+        JOIN users u ON m.user_id = u.id
+        JOIN languages l ON m.language_id = l.id
+        JOIN mistake_categories mc ON m.category_id = mc.id
+        WHERE 1 = 1
+        '''
+        
+        params = []
+        query += self._user_filter(user_names, params)
+        
+        if language_name:
+            query += " AND l.name = ?"
+            params.append(language_name)
+        
+        if since is not None:
+            query += " AND m.timestamp >= datetime(?, 'unixepoch')"
+            params.append(int(since))
+        
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    
+    def fetch_session_rows(self, user_names=None, language_name=None, since=None):
+        """Fetch (user, unix start time, accuracy rate, mistake count) session rows in bulk"""
+        cursor = self.conn.cursor()
+        
+        query = '''
+        SELECT u.name, CAST(strftime('%s', s.start_time) AS INTEGER), s.accuracy_rate, s.mistake_count
+        FROM sessions s
+        JOIN users u ON s.user_id = u.id
+        JOIN languages l ON s.language_id = l.id
+        WHERE s.end_time IS NOT NULL
+        '''
+        
+        params = []
+        query += self._user_filter(user_names, params)
+        
+        if language_name:
+            query += " AND l.name = ?"
+            params.append(language_name)
+        
+        if since is not None:
+            query += " AND s.start_time >= datetime(?, 'unixepoch')"
+            params.append(int(since))
+        
+        query += " ORDER BY s.start_time"
+        
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    
+    def record_token_usage(self, user_name, session_key, model, task, prompt_tokens, completion_tokens, cost=0.0):
+        """Buffer one LLM call's token usage; rows are written in batches"""
+        with self._token_usage_lock:
+            self._token_usage_buffer.append(
+                (user_name, session_key, model, task, prompt_tokens, completion_tokens, cost)
+            )
+            full = len(self._token_usage_buffer) >= TOKEN_USAGE_BATCH_SIZE
+        if full:
+            self.flush_token_usage()
+    
+    def flush_token_usage(self):
+        """Write all buffered token usage records in a single transaction"""
+        with self._token_usage_lock:
+            buffered, self._token_usage_buffer = self._token_usage_buffer, []
+        if not buffered:
+            return
+        
+        user_ids = {name: self.get_or_create_user(name) for name in {row[0] for row in buffered}}
+        
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+        INSERT INTO token_usage (user_id, session_key, model, task, prompt_tokens, completion_tokens, cost)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(user_ids[row[0]],) + row[1:] for row in buffered])
+        
+        self.conn.commit()
+    
+    def get_token_usage(self, user_name=None, session_key=None):
+        """Get token usage totals grouped by model and task for a user and/or session"""
+        self.flush_token_usage()
+        cursor = self.conn.cursor()
+        
+        query = '''
+        SELECT t.model, t.task, COUNT(*) as calls,
+               SUM(t.prompt_tokens), SUM(t.completion_tokens), SUM(t.cost)
+        FROM token_usage t
+        LEFT JOIN users u ON t.user_id = u.id
+        WHERE 1 = 1
+        '''
+        
+        params = []
+        
+        if user_name:
+            query += " AND u.name = ?"
+            params.append(user_name)
+        
+        if session_key:
+            query += " AND t.session_key = ?"
+            params.append(session_key)
+        
+        query += " GROUP BY t.model, t.task ORDER BY SUM(t.prompt_tokens + t.completion_tokens) DESC"
+        
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    
     def close(self):
-        """Close the database connection"""
+        """Flush pending writes and close the database connection"""
         if self.conn:
+            self.flush_token_usage()
+            self.flush_session_stats()
             self.conn.close()
 
     def save_session_stats(self, user_name, language_name, mistake_count, vocab_count, streak):
-        """Save comprehensive session statistics"""
+        """Save statistics for the user's most recent open session (prefer end_session with the session id)"""
         user_id = self.get_or_create_user(user_name)
         language_id = self.get_or_create_language(language_name)
         
         cursor = self.conn.cursor()
         cursor.execute('''
-        UPDATE sessions 
-        SET end_time = CURRENT_TIMESTAMP,
-            mistake_count = ?,
-            vocabulary_learned = ?,
-            learning_streak = ?,
-            accuracy_rate = ?
+        SELECT MAX(id) FROM sessions
         WHERE user_id = ? AND language_id = ? AND end_time IS NULL
-        ''', (mistake_count, vocab_count, streak, 
-              (1 - mistake_count/(vocab_count + mistake_count) if vocab_count + mistake_count > 0 else 1.0),
-              user_id, language_id))
+        ''', (user_id, language_id))
+        row = cursor.fetchone()
+        if not row or row[0] is None:
+            return
         
-        self.conn.commit()
+        # Only that one session: other open sessions of the same learner are left alone
+        self.end_session(
+            row[0], mistake_count, vocab_count=vocab_count, streak=streak,
+            accuracy_rate=(1 - mistake_count/(vocab_count + mistake_count) if vocab_count + mistake_count > 0 else 1.0)
+        )
 
     def track_vocabulary(self, user_name, language_name, word, translation, context):
         """Track new vocabulary learned"""
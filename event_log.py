@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import time
+import threading
+from async_support import run_blocking
+
+try:
+    import fcntl
+except ImportError:  # Windows: compaction runs without a cross-process lock
+    fcntl = None
+
+SESSION_KEY_PATTERN = re.compile(r"^[0-9a-f]{8,64}$")
+
+
+def normalize_event(event_type, fields):
+    """Check the fields compaction writes to the database; raises ValueError for an event it could not write"""
+    if event_type == "mistake":
+        mistake = fields.get("mistake")
+        if not isinstance(mistake, dict):
+            raise ValueError("mistake event without a mistake")
+        if not isinstance(mistake.get("mistake"), str) or not isinstance(mistake.get("correction"), str):
+            raise ValueError("mistake event without mistake and correction text")
+        mistake = dict(mistake)
+        if not isinstance(mistake.get("explanation"), str):
+            mistake["explanation"] = ""
+        if not isinstance(mistake.get("category"), str) or not mistake["category"]:
+            mistake["category"] = "Uncategorized"
+        fields = dict(fields, mistake=mistake)
+    elif event_type == "vocab":
+        if not isinstance(fields.get("word"), str) or not fields["word"]:
+            raise ValueError("vocab event without a word")
+        fields = dict(fields)
+        for name in ("translation", "context"):
+            if not isinstance(fields.get(name), str):
+                fields[name] = ""
+    return fields
+
+
+class SessionEventLog:
+    """Append-only JSON-lines log of one session's events, fsynced in batches
+
+    The file is opened for each write, so a live session holds no file descriptor.
+    """
+
+    def __init__(self, path, fsync_batch=32):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        # Bytes of the log already reflected in the owner's state, and events other writers slipped in
+        self.offset = 0
+        self._missed = []
+        self.closed = False
+
+    def append(self, event_type, **fields):
+        """Append one event; it is durable after the next batched fsync"""
+        event = {"type": event_type, "ts": time.time()}
+        event.update(normalize_event(event_type, fields))
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+        with self._lock:
+            if self.closed:
+                raise ValueError(f"Event log {self.path} is closed")
+            # Every fsync_batch-th event is synced inline; the background loop syncs the rest
+            sync = self._unsynced + 1 >= self.fsync_batch
+            end, missed = run_blocking(self._write, line, sync)
+            self._missed.extend(missed)
+            self.offset = end
+            self._unsynced = 0 if sync else self._unsynced + 1
+
+    def _write(self, line, sync):
+        """Append one line; returns the end offset and events other workers appended since our last read"""
+        # O_APPEND makes each single-write event land whole at the end, even with several writers
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+            if sync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        missed = []
+        if end - len(line) != self.offset:
+            missed, _ = read_events(self.path, self.offset, end - len(line))
+        return end, missed
+
+    def read_new(self):
+        """Events appended by other writers (or before this process opened the log) since the last read"""
+        with self._lock:
+            events, self.offset = run_blocking(read_events, self.path, self.offset)
+            missed, self._missed = self._missed, []
+        return missed + events
+
+    def _sync_locked(self):
+        if self._unsynced:
+            run_blocking(_fsync_path, self.path)
+            self._unsynced = 0
+
+    def sync(self):
+        with self._lock:
+            if not self.closed:
+                self._sync_locked()
+
+    def close(self):
+        """Sync outstanding events; appends fail afterwards"""
+        with self._lock:
+            if self.closed:
+                return
+            self._sync_locked()
+            self.closed = True
+
+
+def _fsync_path(path):
+    """fsync a file by path; it flushes writes made through any descriptor of the file"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_events(path, offset=0, end=None):
+    """Read complete events from a byte offset; returns (events, offset after the last complete line)"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read() if end is None else f.read(end - offset)
+    except FileNotFoundError:
+        return [], offset
+
+    # A crash can leave a torn last line; it is skipped until it is complete
+    complete = data[:data.rfind(b"\n") + 1]
+    events = []
+    for line in complete.splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            print(f"Skipping corrupt event in {path}")
+    return events, offset + len(complete)
+
+
+class EventLogStore:
+    """Per-session event logs in one directory, compacted into the database in the background"""
+
+    def __init__(self, directory=None, fsync_batch=None, fsync_interval=None,
+                 compact_interval=None, idle_timeout=None):
+        self.directory = directory or os.getenv("EVENT_LOG_DIR", "session_logs")
+        self.fsync_batch = fsync_batch or int(os.getenv("EVENT_LOG_FSYNC_BATCH", 32))
+        self.fsync_interval = fsync_interval or float(os.getenv("EVENT_LOG_FSYNC_INTERVAL", 1.0))
+        self.compact_interval = compact_interval or float(os.getenv("EVENT_LOG_COMPACT_INTERVAL", 30))
+        self.idle_timeout = idle_timeout or float(os.getenv("EVENT_LOG_IDLE_TIMEOUT", 900))
+        self.logs = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, session_key):
+        # Session keys end up in file names, so only accept the hex keys the app generates
+        if not SESSION_KEY_PATTERN.match(session_key):
+            raise ValueError(f"Invalid session key: {session_key!r}")
+        return os.path.join(self.directory, f"{session_key}.log")
+
+    def exists(self, session_key):
+        return os.path.exists(self.path_for(session_key))
+
+    def open(self, session_key):
+        """Open (or create) the log of a session; one handle is shared per process and holds no open file"""
+        with self._lock:
+            log = self.logs.get(session_key)
+            if log is None:
+                log = SessionEventLog(self.path_for(session_key), self.fsync_batch)
+                self.logs[session_key] = log
+            return log
+
+    def compact(self, session_key, tracker):
+        """Write the session's mistakes and vocabulary logged since the last compaction to the database
+
+        The rows and the new checkpoint offset are committed in one transaction, so a crash never
+        writes an event twice. Returns the number of events written, or None when another worker
+        holds the log.
+        """
+        return run_blocking(self._compact, session_key, tracker)
+
+    def _compact(self, session_key, tracker):
+        path = self.path_for(session_key)
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, "rb") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None  # Another worker is compacting this session
+
+            header = json.loads(lock_file.readline() or b"{}")
+            if header.get("type") != "session":
+                return 0
+            user_name, language_name = header["user_name"], header["learning_language"]
+            offset = tracker.get_event_log_offset(user_name, session_key) or 0
+
+            events, new_offset = read_events(path, offset)
+            if new_offset == offset:
+                return 0
+            mistakes, vocabulary = [], []
+            for event in events:
+                if event.get("type") not in ("mistake", "vocab"):
+                    continue
+                try:
+                    event = normalize_event(event["type"], event)
+                except ValueError as e:
+                    # Logs written before events were checked on append may hold unwritable events
+                    print(f"Skipping invalid event in {path}: {str(e)}")
+                    continue
+                if event["type"] == "mistake":
+                    mistake = event["mistake"]
+                    mistakes.append((
+                        mistake["mistake"], mistake["correction"], mistake["explanation"], mistake["category"],
+                        mistake.get("rule"), mistake.get("examples"), mistake.get("common_pitfalls")
+                    ))
+                else:
+                    vocabulary.append((event["word"], event["translation"], event["context"]))
+
+            if not tracker.add_logged_events(user_name, language_name, session_key, offset, new_offset,
+                                             mistakes, vocabulary):
+                return 0
+        return len(mistakes) + len(vocabulary)
+
+    def remove(self, session_key):
+        """Close and delete a session's log once it has been compacted; its handle refuses further appends"""
+        with self._lock:
+            log = self.logs.pop(session_key, None)
+        if log is not None:
+            log.close()
+        try:
+            os.remove(self.path_for(session_key))
+        except FileNotFoundError:
+            pass
+
+    def compact_all(self, tracker):
+        """Compact every log in the directory; logs idle past the timeout are removed afterwards"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".log"):
+                continue
+            session_key = name[:-len(".log")]
+            try:
+                self.compact(session_key, tracker)
+                idle = now - os.path.getmtime(os.path.join(self.directory, name))
+                if idle > self.idle_timeout:
+                    self.remove(session_key)
+            except Exception as e:
+                print(f"Error compacting event log {name}: {str(e)}")
+
+    def sync_all(self):
+        with self._lock:
+            logs = list(self.logs.values())
+        for log in logs:
+            log.sync()
+
+    def start(self, tracker):
+        """Start the background fsync/compaction loop (once per process)"""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, args=(tracker,), name="event-log", daemon=True)
+        self._worker.start()
+
+    def _run(self, tracker):
+        # Under gevent this loop is a greenlet: every fsync and compaction goes through run_blocking
+        last_compaction = time.monotonic()
+        while True:
+            time.sleep(self.fsync_interval)
+            try:
+                # Bounds how long an event of an idle session waits for its fsync
+                self.sync_all()
+                if time.monotonic() - last_compaction >= self.compact_interval:
+                    self.compact_all(tracker)
+                    tracker.flush_session_stats()
+                    # Usage of sessions that were never ended would otherwise wait for a full batch
+                    tracker.flush_token_usage()
+                    last_compaction = time.monotonic()
+            except Exception as e:
+                print(f"Error in event log worker: {str(e)}")
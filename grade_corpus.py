@@ -0,0 +1,253 @@
+import os
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+# Loaded before the bot so .env settings (LLM_BACKEND, DATABASE_PATH, ...) apply
+load_dotenv()
+
+from language_learning_bot import LanguageLearningBot
+from sharding import get_tracker
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…。！？])\s+")
+_local = threading.local()
+
+
+def read_records(path):
+    """Stream records from a .jsonl, .csv or .txt (one text per line) file; unparsable lines yield an error"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield row
+        elif path.endswith(".txt"):
+            for line in f:
+                yield {"text": line.strip()} if line.strip() else None
+        else:
+            for line in f:
+                if not line.strip():
+                    yield None
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield {"error": f"Invalid JSON: {str(e)}"}
+
+
+def _worker_bot():
+    """One bot per worker thread; grading never hits the per-session token budget"""
+    bot = getattr(_local, "bot", None)
+    if bot is None:
+        bot = LanguageLearningBot()
+        bot.token_budget = 0
+        bot.token_limit = 0
+        _local.bot = bot
+    return bot
+
+
+def grade_record(record, args, job_key):
+    """Run the mistake analysis on one record (sentence by sentence with --split-sentences)"""
+    user = str(record.get(args.user_field) or args.user)
+    language = record.get("language") or args.language
+    result = {"id": record.get(args.id_field), "user": user, "language": language,
+              "has_mistakes": False, "mistakes": []}
+    if record.get("error"):
+        result["error"] = record["error"]
+        return result
+
+    text = str(record.get(args.text_field) or "").strip()
+    result["text"] = text
+
+    bot = _worker_bot()
+    bot.user_name = user
+    bot.learning_language = language
+    bot.native_language = record.get("native_language") or args.native_language
+    bot.proficiency_level = record.get("level") or args.level
+    bot.session_key = job_key
+
+    units = _SENTENCE_END.split(text) if args.split_sentences else [text]
+    try:
+        for unit in units:
+            if unit.strip():
+                result["mistakes"].extend(bot.analyze_mistakes(unit)["mistakes"])
+    except Exception as e:
+        result["error"] = str(e)
+    result["has_mistakes"] = bool(result["mistakes"])
+    return result
+
+
+class Checkpoint:
+    """Index of the next record to write and the output size at that point, replaced atomically"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # job_id keys the job's progress in the database, so --restart starts a new job
+            return {"next_index": 0, "output_size": 0, "graded": 0, "mistakes": 0, "errors": 0,
+                    "job_id": os.urandom(8).hex()}
+
+    def save(self, state):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+
+class ResultWriter:
+    """Writes finished records in input order, in batches: database (with the job's progress), then output file,
+    then checkpoint"""
+
+    def __init__(self, tracker, output, checkpoint, state, batch_size):
+        self.tracker = tracker
+        self.output = output
+        self.checkpoint = checkpoint
+        self.state = state
+        self.batch_size = batch_size
+        self._finished = {}
+        self._batch = []
+        self._started = time.perf_counter()
+        self._graded_at_start = state["graded"]
+
+    def finish(self, index, result):
+        """Accept a result (None for blank lines) and flush once a full in-order batch is ready"""
+        self._finished[index] = result
+        while self.state["next_index"] in self._finished:
+            self._batch.append((self.state["next_index"], self._finished.pop(self.state["next_index"])))
+            self.state["next_index"] += 1
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self._batch:
+            self.checkpoint.save(self.state)
+            return
+
+        rows = []
+        lines = []
+        for index, result in self._batch:
+            if result is None:
+                continue
+            self.state["graded"] += 1
+            self.state["errors"] += 1 if result.get("error") else 0
+            self.state["mistakes"] += len(result.get("mistakes", []))
+            lines.append(json.dumps(dict(result, index=index), ensure_ascii=False) + "\n")
+            for mistake in result.get("mistakes", []):
+                rows.append((
+                    result["user"], result["language"],
+                    mistake.get("mistake", ""), mistake.get("correction", ""),
+                    mistake.get("explanation", ""), mistake.get("category", ""),
+                    mistake.get("rule"), mistake.get("examples"), mistake.get("common_pitfalls")
+                ))
+        self._batch = []
+
+        if self.tracker is not None and rows:
+            # Rows and progress commit together, so a batch resumed after a crash is never written twice
+            self.tracker.add_job_mistakes(self.state["job_id"], self.state["next_index"], rows)
+        if self.output is not None:
+            self.output.write("".join(lines).encode("utf-8"))
+            self.output.flush()
+            os.fsync(self.output.fileno())
+            self.state["output_size"] = self.output.tell()
+        self.checkpoint.save(self.state)
+
+        rate = (self.state["graded"] - self._graded_at_start) / (time.perf_counter() - self._started)
+        print(f"Graded {self.state['graded']} records, {self.state['mistakes']} mistakes, "
+              f"{self.state['errors']} errors ({rate:.1f} records/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Grade a corpus (JSONL, CSV or text lines) with the bot's mistake analysis. "
+                    "Interrupted jobs resume from their checkpoint."
+    )
+    parser.add_argument("input", help="Corpus file: .jsonl, .csv or .txt")
+    parser.add_argument("--output", help="Graded records as JSONL (default: <input>.graded.jsonl)")
+    parser.add_argument("--checkpoint", help="Progress file (default: <output>.ckpt)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start over")
+    parser.add_argument("--workers", type=int, default=16, help="Records analyzed concurrently")
+    parser.add_argument("--batch-size", type=int, default=200, help="Records per database write and checkpoint")
+    parser.add_argument("--language", default="Spanish", help="Learning language when a record has none")
+    parser.add_argument("--native-language", default="English", help="Explanation language when a record has none")
+    parser.add_argument("--level", default="intermediate", help="Proficiency level when a record has none")
+    parser.add_argument("--user", default="corpus", help="User name when a record has none")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--user-field", default="user")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--split-sentences", action="store_true", help="Analyze long texts sentence by sentence")
+    parser.add_argument("--no-db", action="store_true", help="Only write the output file")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.splitext(args.input)[0] + ".graded.jsonl"
+    checkpoint = Checkpoint(args.checkpoint or output_path + ".ckpt")
+    if args.restart and os.path.exists(checkpoint.path):
+        os.remove(checkpoint.path)
+    state = checkpoint.load()
+    if state["next_index"]:
+        print(f"Resuming at record {state['next_index']}")
+
+    # Drop output written after the last checkpoint so resumed output has no duplicates
+    with open(output_path, "ab"):
+        pass
+    output = open(output_path, "r+b")
+    output.truncate(state["output_size"])
+    output.seek(state["output_size"])
+
+    tracker = None if args.no_db else get_tracker()
+    writer = ResultWriter(tracker, output, checkpoint, state, args.batch_size)
+    job_key = os.urandom(8).hex()
+    max_pending = args.workers * 2
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            index = pending.pop(future)
+            try:
+                writer.finish(index, future.result())
+            except Exception as e:
+                writer.finish(index, {"user": args.user, "language": args.language,
+                                      "has_mistakes": False, "mistakes": [], "error": str(e)})
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="grader") as pool:
+            for index, record in enumerate(read_records(args.input)):
+                if index < state["next_index"]:
+                    continue
+                if record is None:
+                    writer.finish(index, None)
+                    continue
+                # Bounded read-ahead: a million-line corpus is never held in memory
+                while len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[pool.submit(grade_record, record, args, job_key)] = index
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        writer.flush()
+    except KeyboardInterrupt:
+        # Results already written are covered by the checkpoint; the rest is redone on resume
+        print(f"Interrupted; rerun the same command to resume at record {checkpoint.load()['next_index']}")
+        return 130
+    finally:
+        output.close()
+        if tracker is not None:
+            tracker.flush_token_usage()
+
+    print(f"Done: {state['graded']} records, {state['mistakes']} mistakes, {state['errors']} errors -> {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
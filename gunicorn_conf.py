@@ -0,0 +1,15 @@
+import os
+from async_support import ASYNC_MODE
+
+# Live sessions are kept in process memory, so default to a single worker; in async mode
+# that one process holds thousands of conversations waiting on the LLM.
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+if ASYNC_MODE == "gevent":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("WORKER_CONNECTIONS", 2000))
+else:
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", 8))
@@ -0,0 +1,110 @@
+import os
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are gzip-compressed only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/css", "text/plain", "text/javascript",
+    "application/javascript", "application/json", "image/svg+xml",
+)
+
+# Fingerprinted static URLs never change content, so clients may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def choose_encoding(accept_encoding):
+    """Best encoding the client accepts: brotli when available, then gzip, else None"""
+    if brotli is not None and accept_encoding["br"]:
+        return "br"
+    if accept_encoding["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding, level):
+    if encoding == "br":
+        # COMPRESS_LEVEL (1-9) is used as the brotli quality too; 10-11 are too slow for per-response use
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class ResponseCompressor:
+    """Compress eligible responses; static files are compressed once per file version"""
+
+    def __init__(self, min_size=None, level=None):
+        self.min_size = min_size if min_size is not None else int(os.getenv("COMPRESS_MIN_SIZE", 500))
+        self.level = level if level is not None else int(os.getenv("COMPRESS_LEVEL", 6))
+        self._static = {}
+        self._lock = threading.Lock()
+
+    def compress(self, request, response):
+        if (response.status_code != 200 or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES
+                or (response.is_streamed and request.endpoint != "static")):
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            return response
+
+        static_key = None
+        if request.endpoint == "static":
+            # Static files come back as passthrough file wrappers; read them so they can be compressed
+            response.direct_passthrough = False
+            static_key = (request.path, response.get_etag()[0], encoding)
+            with self._lock:
+                cached = self._static.get(static_key)
+            if cached is not None:
+                # The file is never read, so close it before the body is replaced
+                if hasattr(response.response, "close"):
+                    response.response.close()
+                return self._apply(response, cached, encoding)
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        compressed = _compress(data, encoding, self.level)
+        if static_key is not None:
+            with self._lock:
+                self._static[static_key] = compressed
+        return self._apply(response, compressed, encoding)
+
+    @staticmethod
+    def _apply(response, data, encoding):
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        # The compressed body has different bytes, so a strong validator becomes weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+class StaticFingerprints:
+    """Content hashes of static files, used as a version query string on their URLs"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._versions.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+        with self._lock:
+            self._versions[filename] = (mtime, digest)
+        return digest
@@ -1,12 +1,20 @@
 import os
+import time
 import openai
 import json
 import traceback
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from langchain.chains import LLMChain
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from db_manager import MistakeTracker
+from langchain_community.callbacks import get_openai_callback
+from sharding import get_tracker
+from llm_backends import create_llm
+from model_router import ModelRouter
+from conversation import ConversationHistory
+from vocab_packs import get_vocab_packs, normalize, KIND_WORD, KIND_PHRASE, KIND_MISTAKE
+from metrics import registry, timed
+from single_flight import llm_calls, prompt_key
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,6 +22,50 @@ load_dotenv()
 # Initialize OpenAI API key from environment variables
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# Conversation scenes offered by the CLI
+SCENES = {
+    "1": "at a restaurant",
+    "2": "shopping at a store",
+    "3": "asking for directions",
+    "4": "meeting new people",
+    "5": "at a hotel"
+}
+
+PROFICIENCY_LEVELS = ("beginner", "intermediate", "advanced")
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a session has used up its hard token limit"""
+    pass
+
+def parse_mistake_analysis(text):
+    """Parse and validate the mistake analysis JSON returned by the model"""
+    text = text.strip()
+    if text.startswith("```"):
+        # Models often wrap JSON in a markdown code fence
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+    
+    data = json.loads(text)
+    if not isinstance(data, dict) or not isinstance(data.get("has_mistakes"), bool):
+        raise ValueError("Mistake analysis is missing has_mistakes")
+    
+    mistakes = data.get("mistakes", [])
+    if not isinstance(mistakes, list):
+        raise ValueError("Mistake analysis mistakes is not a list")
+    for mistake in mistakes:
+        # The database columns are NOT NULL, so a null correction must not get past here
+        if (not isinstance(mistake, dict) or not mistake.get("mistake") or not isinstance(mistake["mistake"], str)
+                or not isinstance(mistake.get("correction"), str)):
+            raise ValueError("Mistake entry is missing mistake/correction")
+        if not isinstance(mistake.get("category"), str) or not mistake["category"]:
+            mistake["category"] = "Uncategorized"
+    if data["has_mistakes"] and not mistakes:
+        raise ValueError("Mistake analysis reports mistakes but lists none")
+    
+    data["mistakes"] = mistakes
+    return data
+
 class LanguageLearningBot:
     def __init__(self):
         self.user_name = ""
@@ -21,22 +73,50 @@ class LanguageLearningBot:
         self.learning_language = ""
         self.proficiency_level = ""
         self.selected_scene = ""
-        self.conversation_history = []
+        self.conversation_history = ConversationHistory()
         self.mistakes = []
         self.session_start_time = None
         self.vocabulary_learned = set()
         self.consecutive_correct_responses = 0
         self.learning_streak = 0
+        self.weakness_profile = None
+        
+        # Offline vocabulary pack for the language, scene and level (None when no pack was built)
+        self.vocab_pack = None
+        
+        # Database session row and its running counters (user turns, and turns without mistakes)
+        self.db_session_id = None
+        self.total_interactions = 0
+        self.correct_interactions = 0
+        
+        # Append-only event log the session can be rebuilt from (set by the web app)
+        self.event_log = None
+        
+        # Opening turn, possibly generated speculatively before the user's first message
+        self.opening = None
+        self.opening_future = None
+        
+        # Last review served by the web app, as (etag, payload); reused until new mistakes arrive
+        self.last_review = None
+        
+        # Token accounting and budget enforcement (0 disables a limit)
+        self.session_key = os.urandom(8).hex()
+        self.session_tokens = 0
+        self.token_budget = int(os.getenv("SESSION_TOKEN_BUDGET", 0))
+        self.token_limit = int(os.getenv("SESSION_TOKEN_LIMIT", 0))
+        self.fallback_model = os.getenv("FALLBACK_MODEL", "gpt-3.5-turbo")
+        self.degraded = False
+        self.budget_hooks = [LanguageLearningBot.degrade_model]
+        
+        # Routes analysis tasks between a fast and a strong model
+        self.router = ModelRouter()
         
         try:
             # Initialize LLM with model from environment variable
-            self.llm = ChatOpenAI(
-                model_name=os.getenv("LANGUAGE_MODEL", "gpt-3.5-turbo"),
-                temperature=float(os.getenv("TEMPERATURE", 0.7)),
-            )
+            self.llm = create_llm()
             
-            # Initialize database manager
-            self.db_manager = MistakeTracker("language_learning.db")
+            # Shared, sharded database manager (DATABASE_PATH / DB_SHARDS)
+            self.db_manager = get_tracker()
         except Exception as e:
             print(f"Error initializing bot: {str(e)}")
             raise
@@ -71,6 +151,11 @@ class LanguageLearningBot:
             # Select a conversation scene
             self.select_scene()
             
+            # Load what this learner usually gets wrong and the scene's vocabulary
+            self.load_weakness_profile()
+            self.load_vocab_pack()
+            self.begin_db_session()
+            
             # Start the conversation
             self.have_conversation()
         except Exception as e:
@@ -87,18 +172,341 @@ class LanguageLearningBot:
         print("5. At a hotel")
         
         scene_choice = input("Enter the number of your choice: ")
-        scenes = {
-            "1": "at a restaurant",
-            "2": "shopping at a store",
-            "3": "asking for directions",
-            "4": "meeting new people",
-            "5": "at a hotel"
-        }
-        
-        self.selected_scene = scenes.get(scene_choice, "at a restaurant")
+        self.selected_scene = SCENES.get(scene_choice, "at a restaurant")
         print(f"\nGreat! We'll practice {self.learning_language} in a scenario: {self.selected_scene}.")
     
-    def create_system_prompt(self):
+    def load_weakness_profile(self):
+        """Load the learner's precomputed weakness profile for the selected language"""
+        try:
+            self.weakness_profile = self.db_manager.get_weakness_profile(self.user_name, self.learning_language)
+        except Exception as e:
+            print(f"Error loading weakness profile: {str(e)}")
+            self.weakness_profile = None
+        return self.weakness_profile
+    
+    def load_vocab_pack(self):
+        """Find the precomputed vocabulary pack for the session's languages, scene and level"""
+        packs = get_vocab_packs()
+        self.vocab_pack = packs.get(
+            self.learning_language, self.native_language, self.selected_scene, self.proficiency_level
+        ) if packs else None
+        return self.vocab_pack
+    
+    def vocabulary_hints(self, limit=10):
+        """Scene words and phrases from the pack the learner hasn't used yet"""
+        if self.vocab_pack is None:
+            return []
+        hints = []
+        for _, (term, translation) in self.vocab_pack.entries((KIND_WORD, KIND_PHRASE)):
+            if normalize(term) not in self.vocabulary_learned:
+                hints.append(f"{term} ({translation})" if translation else term)
+                if len(hints) >= limit:
+                    break
+        return hints
+    
+    def track_pack_vocabulary(self, text):
+        """Record the pack words and phrases the learner used in a message (no LLM call)"""
+        if self.vocab_pack is None:
+            return
+        for kind, strings in self.vocab_pack.scan(text):
+            if kind == KIND_MISTAKE or normalize(strings[0]) in self.vocabulary_learned:
+                continue
+            try:
+                self.note_vocabulary(normalize(strings[0]), strings[1], self.selected_scene)
+            except Exception as e:
+                print(f"Error tracking vocabulary: {str(e)}")
+    
+    def precheck_mistakes(self, text):
+        """Rule-based check against the pack: (known mistakes found, whether the text is a known-correct entry)"""
+        if self.vocab_pack is None:
+            return [], False
+        mistakes = [
+            {
+                "mistake": strings[0],
+                "correction": strings[1],
+                "category": strings[2],
+                "explanation": strings[3],
+                "rule": "",
+                "examples": [],
+                "common_pitfalls": ""
+            }
+            for kind, strings in self.vocab_pack.scan(text) if kind == KIND_MISTAKE
+        ]
+        entry = self.vocab_pack.lookup(normalize(text))
+        return mistakes, entry is not None and entry[0] != KIND_MISTAKE
+    
+    def run_chain(self, chain, inputs, task):
+        """Invoke an LLM chain, recording latency and token usage for the task"""
+        if self.token_limit and self.session_tokens >= self.token_limit:
+            raise TokenBudgetExceeded(
+                f"Session used {self.session_tokens} tokens (limit {self.token_limit})"
+            )
+        
+        model = getattr(chain.llm, "model_name", "unknown")
+        
+        def invoke():
+            with get_openai_callback() as usage, \
+                    timed("llm_request_duration_seconds", "Latency of LLM calls", task=task, model=model):
+                response = chain.invoke(inputs)
+            return response, usage
+        
+        # Identical prompts already in flight for other sessions share that request
+        key = prompt_key(chain, inputs) if llm_calls.enabled else None
+        (response, usage), shared = llm_calls.do(key, invoke)
+        registry.inc("llm_single_flight_calls_total", 1, "LLM calls by single-flight outcome",
+                     task=task, outcome="coalesced" if shared else "upstream")
+        if shared:
+            # The tokens were spent (and accounted) by the session that made the call
+            return dict(response)
+        
+        registry.inc("llm_tokens_total", usage.prompt_tokens, "Tokens consumed by LLM calls",
+                     task=task, model=model, type="prompt")
+        registry.inc("llm_tokens_total", usage.completion_tokens, "Tokens consumed by LLM calls",
+                     task=task, model=model, type="completion")
+        
+        self.record_usage(model, task, usage.prompt_tokens, usage.completion_tokens, usage.total_cost)
+        return response
+    
+    def record_usage(self, model, task, prompt_tokens, completion_tokens, cost):
+        """Account one LLM call against the session and run budget hooks when over budget"""
+        self.session_tokens += prompt_tokens + completion_tokens
+        self.log_event("usage", tokens=prompt_tokens + completion_tokens)
+        
+        try:
+            self.db_manager.record_token_usage(
+                self.user_name, self.session_key, model, task, prompt_tokens, completion_tokens, cost
+            )
+        except Exception as e:
+            print(f"Error recording token usage: {str(e)}")
+        
+        if self.token_budget and self.session_tokens >= self.token_budget:
+            for hook in self.budget_hooks:
+                hook(self)
+    
+    def degrade_model(self):
+        """Budget hook: switch the rest of the session to the cheaper fallback model"""
+        if self.degraded or getattr(self.llm, "model_name", None) == self.fallback_model:
+            return
+        
+        print(f"Session {self.session_key} exceeded {self.token_budget} tokens, "
+              f"switching to {self.fallback_model}")
+        previous_llm = self.llm
+        self.llm = create_llm(self.fallback_model)
+        self.degraded = True
+        
+        # Every chain built with the previous model must be rebuilt
+        for name, value in list(vars(self).items()):
+            if isinstance(value, LLMChain) and value.llm is previous_llm:
+                delattr(self, name)
+    
+    def log_event(self, event_type, **fields):
+        """Append an event to the session's log; returns False when there is no log or it failed"""
+        if self.event_log is None:
+            return False
+        try:
+            self.event_log.append(event_type, **fields)
+            return True
+        except Exception as e:
+            print(f"Error writing session event: {str(e)}")
+            return False
+    
+    def apply_event(self, event):
+        """Replay one logged event onto this bot's state"""
+        event_type = event.get("type")
+        if event_type == "session":
+            for field in ("user_name", "native_language", "learning_language", "proficiency_level", "selected_scene"):
+                setattr(self, field, event.get(field, ""))
+            self.db_session_id = event.get("db_session_id")
+            self.session_start_time = event.get("ts")
+        elif event_type == "interaction":
+            self._count_interaction(event["had_mistakes"])
+        elif event_type == "turn":
+            self.conversation_history.add(event["role"], event["content"])
+        elif event_type == "mistake":
+            self.mistakes.append(event["mistake"])
+        elif event_type == "vocab":
+            self.vocabulary_learned.add(event["word"])
+        elif event_type == "usage":
+            self.session_tokens += event.get("tokens", 0)
+    
+    def catch_up(self):
+        """Apply events other workers appended to this session's log"""
+        if self.event_log is not None:
+            for event in self.event_log.read_new():
+                self.apply_event(event)
+    
+    @classmethod
+    def from_event_log(cls, session_key, event_log):
+        """Rebuild a web session's bot from its event log, e.g. after a worker restart"""
+        bot = cls()
+        bot.session_key = session_key
+        bot.event_log = event_log
+        bot.catch_up()
+        if not bot.user_name:
+            return None
+        
+        bot.load_weakness_profile()
+        bot.load_vocab_pack()
+        if bot.token_budget and bot.session_tokens >= bot.token_budget:
+            for hook in bot.budget_hooks:
+                hook(bot)
+        return bot
+    
+    def begin_db_session(self):
+        """Create the database row for this session; its id keys every stats update"""
+        self.session_start_time = time.time()
+        try:
+            self.db_session_id = self.db_manager.start_session(
+                self.user_name, self.learning_language, self.proficiency_level, self.selected_scene
+            )
+        except Exception as e:
+            print(f"Error starting database session: {str(e)}")
+    
+    def accuracy_rate(self):
+        """Share of the learner's turns without mistakes"""
+        if not self.total_interactions:
+            return 1.0
+        return self.correct_interactions / self.total_interactions
+    
+    def session_stats(self):
+        """Counters in record_session_stats order"""
+        return (
+            self.total_interactions,
+            len(self.mistakes),
+            len(self.vocabulary_learned),
+            self.learning_streak,
+            self.accuracy_rate()
+        )
+    
+    def _count_interaction(self, had_mistakes):
+        self.total_interactions += 1
+        if had_mistakes:
+            self.consecutive_correct_responses = 0
+        else:
+            self.correct_interactions += 1
+            self.consecutive_correct_responses += 1
+            self.learning_streak = max(self.learning_streak, self.consecutive_correct_responses)
+    
+    def record_interaction(self, had_mistakes):
+        """Update the session counters for one analyzed learner turn; the database row is updated in batches"""
+        self._count_interaction(had_mistakes)
+        self.log_event("interaction", had_mistakes=had_mistakes)
+        if self.db_session_id is None:
+            return
+        try:
+            self.db_manager.record_session_stats(self.db_session_id, *self.session_stats())
+        except Exception as e:
+            print(f"Error recording session stats: {str(e)}")
+    
+    def finish_db_session(self):
+        """Write the final counters and end time of this session's database row"""
+        if self.db_session_id is None:
+            return
+        total_interactions, mistake_count, vocab_count, streak, accuracy_rate = self.session_stats()
+        try:
+            self.db_manager.end_session(
+                self.db_session_id, mistake_count,
+                total_interactions=total_interactions,
+                vocab_count=vocab_count,
+                streak=streak,
+                accuracy_rate=accuracy_rate
+            )
+            self.db_session_id = None
+        except Exception as e:
+            print(f"Error ending database session: {str(e)}")
+    
+    def add_turn(self, role, content):
+        """Add a turn to the conversation history and the session's log"""
+        self.conversation_history.add(role, content)
+        self.log_event("turn", role=role, content=content)
+    
+    def note_vocabulary(self, word, translation="", context=""):
+        """Record a word or phrase the learner used; logged sessions write it to the database on compaction"""
+        self.vocabulary_learned.add(word)
+        if not self.log_event("vocab", word=word, translation=translation, context=context):
+            self.db_manager.track_vocabulary(self.user_name, self.learning_language, word, translation, context)
+    
+    def llm_for_task(self, task, text=""):
+        """Pick the model for a task; a degraded session stays on its fallback model"""
+        if self.degraded:
+            return "strong", self.llm
+        return self.router.route(task, text, self.proficiency_level)
+    
+    def get_conversation_chain(self):
+        """Build the conversation chain once per session and reuse it for every turn"""
+        if not hasattr(self, "conversation_chain"):
+            conversation_prompt = ChatPromptTemplate.from_messages([
+                ("system", self.create_system_prompt()),
+                ("human", "{input}")
+            ])
+            
+            self.conversation_chain = LLMChain(
+                llm=self.llm,
+                prompt=conversation_prompt,
+                verbose=False
+            )
+        return self.conversation_chain
+    
+    def create_opening_input(self):
+        """The learner greeting that starts every conversation"""
+        return f"Hi, I'm {self.user_name}. I'm here to practice {self.learning_language}."
+    
+    def generate_opening(self):
+        """Generate the assistant's opening turn for the selected scene"""
+        response = self.run_chain(self.get_conversation_chain(), {"input": self.create_opening_input()}, "opening")
+        return response["text"]
+    
+    def take_opening(self, timeout=None):
+        """Return the prefetched opening turn (waiting at most timeout seconds if still generating), or None"""
+        opening, future = self.opening, self.opening_future
+        self.opening, self.opening_future = None, None
+        
+        if opening is None and future is not None:
+            try:
+                opening = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                print(f"Prefetched opening not ready after {timeout}s; answering directly")
+                return None
+            except Exception as e:
+                print(f"Error prefetching opening: {str(e)}")
+                return None
+        return opening
+    
+    def create_weakness_prompt(self):
+        """Describe the learner's recurring mistakes for the system prompt"""
+        if not self.weakness_profile or not self.weakness_profile["total_mistakes"]:
+            return ""
+        
+        categories = ", ".join(
+            f"{category} ({count})" for category, count in self.weakness_profile["top_categories"]
+        )
+        pairs = "\n".join(
+            f'           * "{mistake}" -> "{correction}" ({count}x)'
+            for mistake, correction, count in self.weakness_profile["frequent_pairs"]
+        )
+        # The system prompt is used as a prompt template, so learner text must not add variables
+        categories = categories.replace("{", "{{").replace("}", "}}")
+        pairs = pairs.replace("{", "{{").replace("}", "}}")
+        return f"""
+        7. Learner's Recurring Weaknesses (from previous sessions):
+           - Most frequent mistake categories: {categories}
+           - Mistakes they have repeated:
+{pairs}
+           - Naturally create opportunities to practice these areas
+           - Praise them explicitly when they get one of these right
+        """
+    
+    def create_vocabulary_prompt(self):
+        """List the scene vocabulary from the pack so the model doesn't have to invent it"""
+        hints = self.vocabulary_hints()
+        if not hints:
+            return ""
+        # The system prompt is used as a prompt template, so pack text must not add variables
+        vocabulary = ", ".join(hints).replace("{", "{{").replace("}", "}}")
+        return f"""   - Key vocabulary for this scene: {vocabulary}
+        """
+    
+    def create_system_prompt(self, include_weaknesses=True):
         """Create the system prompt for the language learning conversation"""
         system_prompt = f"""
         You are an expert language learning assistant helping someone learn {self.learning_language}. 
@@ -147,7 +555,7 @@ class LanguageLearningBot:
            - Create realistic dialogue situations
            - Introduce typical vocabulary for this context
            - Guide user through common interactions in this setting
-
+        {self.create_vocabulary_prompt()}{self.create_weakness_prompt() if include_weaknesses else ""}
         Remember to keep the conversation engaging, natural, and encouraging while maintaining a clear focus on learning.
         """
         return system_prompt
@@ -155,27 +563,12 @@ class LanguageLearningBot:
     def have_conversation(self):
         """Have a conversation with the user in the learning language"""
         try:
-            system_prompt = self.create_system_prompt()
-            
-            # Create conversation template
-            conversation_prompt = ChatPromptTemplate.from_messages([
-                ("system", system_prompt),
-                ("human", "{input}")
-            ])
-            
-            # Create conversation chain
-            conversation_chain = LLMChain(
-                llm=self.llm,
-                prompt=conversation_prompt,
-                verbose=True
-            )
-            
             # Initialize the conversation
-            response = conversation_chain.invoke({"input": f"Hi, I'm {self.user_name}. I'm here to practice {self.learning_language}."})
-            print("\nAssistant:", response["text"])
+            opening = self.generate_opening()
+            print("\nAssistant:", opening)
             
             # Add to conversation history
-            self.conversation_history.append({"role": "assistant", "content": response["text"]})
+            self.add_turn("assistant", opening)
             
             # Main conversation loop
             while True:
@@ -185,7 +578,8 @@ class LanguageLearningBot:
                     break
                     
                 # Add to conversation history
-                self.conversation_history.append({"role": "user", "content": user_input})
+                self.add_turn("user", user_input)
+                self.track_pack_vocabulary(user_input)
                 
                 # Check for mistakes and provide feedback using a separate LLM call
                 if len(self.conversation_history) > 1:
@@ -193,26 +587,32 @@ class LanguageLearningBot:
                 
                 try:
                     # Get response from the assistant
-                    full_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history])
-                    response = conversation_chain.invoke({"input": user_input + "\n\nConversation history:\n" + full_history})
+                    full_history = self.conversation_history.render()
+                    response = self.run_chain(
+                        self.get_conversation_chain(),
+                        {"input": user_input + "\n\nConversation history:\n" + full_history},
+                        "conversation"
+                    )
                     
                     print("\nAssistant:", response["text"])
                     
                     # Add to conversation history
-                    self.conversation_history.append({"role": "assistant", "content": response["text"]})
+                    self.add_turn("assistant", response["text"])
                 except Exception as e:
                     print(f"\nError getting response: {str(e)}")
                     print("Let's continue the conversation.")
             
             # Provide review and feedback at the end
             self.provide_review()
+            self.finish_db_session()
+            self.db_manager.flush_token_usage()
         except Exception as e:
             print(f"Error in conversation: {str(e)}")
             traceback.print_exc()
     
-    def check_for_mistakes(self, user_input):
-        """Enhanced mistake checking with detailed feedback"""
-        mistake_prompt = ChatPromptTemplate.from_messages([
+    def create_mistake_prompt(self):
+        """Create the prompt for the structured mistake analysis"""
+        return ChatPromptTemplate.from_messages([
             ("system", f"""
             You are an expert language teacher analyzing text in {self.learning_language}.
             The user's native language is {self.native_language} and their proficiency level is {self.proficiency_level}.
@@ -236,10 +636,10 @@ class LanguageLearningBot:
                - 2 example sentences showing correct usage
             
             Format your response as JSON:
-            {{
+            {{{{
                 "has_mistakes": true/false,
                 "mistakes": [
-                    {{
+                    {{{{
                         "mistake": "incorrect text",
                         "correction": "corrected text",
                         "explanation": "detailed explanation",
@@ -247,47 +647,86 @@ class LanguageLearningBot:
                         "category": "grammar/vocabulary/etc.",
                         "examples": ["example1", "example2"],
                         "common_pitfalls": "related mistakes to watch for"
-                    }}
+                    }}}}
                 ],
                 "positive_feedback": "what the user did well",
                 "learning_tips": "specific suggestions for improvement"
-            }}
+            }}}}
             """),
-            ("human", user_input)
+            ("human", "{input}")
         ])
+    
+    def analyze_mistakes(self, user_input):
+        """Run the mistake analysis, escalating to the strong model if the fast model's JSON is invalid"""
+        mistake_prompt = self.create_mistake_prompt()
+        tier, llm = self.llm_for_task("mistake_analysis", user_input)
         
-        mistake_chain = LLMChain(
-            llm=self.llm,
-            prompt=mistake_prompt,
-            verbose=False
-        )
+        mistake_chain = LLMChain(llm=llm, prompt=mistake_prompt, verbose=False)
+        mistake_analysis = self.run_chain(mistake_chain, {"input": user_input}, "mistake_analysis")
         
         try:
-            # Get mistake analysis
-            mistake_analysis = mistake_chain.invoke({"input": user_input})
-            mistake_text = mistake_analysis.get("text", "{}")
-            
-            # Parse the JSON response
-            mistake_data = json.loads(mistake_text)
+            return parse_mistake_analysis(mistake_analysis.get("text", "{}"))
+        except ValueError:
+            if tier != "fast":
+                raise
+        
+        mistake_chain = LLMChain(llm=self.router.escalate("mistake_analysis"), prompt=mistake_prompt, verbose=False)
+        mistake_analysis = self.run_chain(mistake_chain, {"input": user_input}, "mistake_analysis")
+        return parse_mistake_analysis(mistake_analysis.get("text", "{}"))
+    
+    def check_for_mistakes(self, user_input):
+        """Enhanced mistake checking with detailed feedback"""
+        try:
+            known_mistakes, known_correct = self.precheck_mistakes(user_input)
+            if known_correct:
+                # A pack word or phrase on its own needs no analysis
+                registry.inc("vocab_pack_prechecks_total", 1, "Mistake checks answered by a vocabulary pack",
+                             outcome="known_correct")
+                mistake_data = {"has_mistakes": False, "mistakes": []}
+            else:
+                try:
+                    # Get mistake analysis
+                    mistake_data = self.analyze_mistakes(user_input)
+                except Exception:
+                    if not known_mistakes:
+                        raise
+                    mistake_data = {"has_mistakes": False, "mistakes": []}
+                
+                # Add the pack's known mistakes the model didn't report
+                reported = {normalize(mistake.get("mistake", "")) for mistake in mistake_data["mistakes"]}
+                for mistake in known_mistakes:
+                    if normalize(mistake["mistake"]) not in reported:
+                        registry.inc("vocab_pack_prechecks_total", 1, "Mistake checks answered by a vocabulary pack",
+                                     outcome="known_mistake")
+                        mistake_data["mistakes"].append(mistake)
+                mistake_data["has_mistakes"] = bool(mistake_data["mistakes"])
+            self.record_interaction(bool(mistake_data.get("has_mistakes", False)))
             
             if mistake_data.get("has_mistakes", False):
                 for mistake in mistake_data.get("mistakes", []):
                     # Add to the mistake list
                     self.mistakes.append(mistake)
                     
-                    # Save to database
+                    # Logged sessions reach the database on compaction; otherwise save it now
+                    if self.log_event("mistake", mistake=mistake):
+                        continue
                     self.db_manager.add_mistake(
                         self.user_name,
                         self.learning_language,
                         mistake.get("mistake", ""),
                         mistake.get("correction", ""),
                         mistake.get("explanation", ""),
-                        mistake.get("category", "")
+                        mistake.get("category", ""),
+                        rule=mistake.get("rule"),
+                        examples=mistake.get("examples"),
+                        common_pitfalls=mistake.get("common_pitfalls")
                     )
+            
+            return mistake_data
         except Exception as e:
             print(f"Error analyzing mistakes: {str(e)}")
             # If there's an error parsing the response, just continue
-            pass
+            return None
     
     def provide_review(self):
         """Enhanced review with comprehensive feedback"""
@@ -319,13 +758,10 @@ class LanguageLearningBot:
                     for example in mistake.get('examples', []):
                         print(f"      - {example}")
         
-        # Calculate progress metrics
-        total_interactions = len(self.conversation_history) // 2
-        mistake_rate = len(self.mistakes) / total_interactions
-        
+        # Progress metrics are maintained turn by turn
         print("\n📈 Progress Metrics:")
-        print(f"- Total Interactions: {total_interactions}")
-        print(f"- Accuracy Rate: {(1 - mistake_rate) * 100:.1f}%")
+        print(f"- Total Interactions: {self.total_interactions}")
+        print(f"- Accuracy Rate: {self.accuracy_rate() * 100:.1f}%")
         print(f"- New Vocabulary Learned: {len(self.vocabulary_learned)} words/phrases")
         print(f"- Learning Streak: {self.learning_streak} correct responses")
         
@@ -363,16 +799,17 @@ class LanguageLearningBot:
 
             Make suggestions practical and actionable.
             """),
-            ("human", str(categories))
+            ("human", "{input}")
         ])
         
+        _, llm = self.llm_for_task("suggestions", str(categories))
         suggestion_chain = LLMChain(
-            llm=self.llm,
+            llm=llm,
             prompt=suggestion_prompt,
             verbose=False
         )
         
-        suggestions = suggestion_chain.invoke({"input": str(categories)})
+        suggestions = self.run_chain(suggestion_chain, {"input": str(categories)}, "suggestions")
         print("\n🎯 Personalized Improvement Plan")
         print(suggestions["text"])
         
@@ -380,15 +817,6 @@ class LanguageLearningBot:
         print("- Every mistake is a learning opportunity")
         print("- Consistent practice leads to improvement")
         print("- You're making progress with each conversation!")
-        
-        # Save session statistics to database
-        self.db_manager.save_session_stats(
-            self.user_name,
-            self.learning_language,
-            len(self.mistakes),
-            len(self.vocabulary_learned),
-            self.learning_streak
-        )
 
 if __name__ == "__main__":
     try:
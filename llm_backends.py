@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import httpx
+from langchain_openai import ChatOpenAI
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+# Chat models are stateless, so bots share one client (and one connection pool) per model
+_llm_cache = {}
+_llm_cache_lock = threading.Lock()
+
+
+def create_llm(model_name=None, temperature=None):
+    """Get the shared chat model for the configured backend (LLM_BACKEND=openai|fake)"""
+    model_name = model_name or os.getenv("LANGUAGE_MODEL", "gpt-3.5-turbo")
+    if temperature is None:
+        temperature = float(os.getenv("TEMPERATURE", 0.7))
+    backend = os.getenv("LLM_BACKEND", "openai").lower()
+
+    key = (backend, model_name, temperature)
+    with _llm_cache_lock:
+        if key not in _llm_cache:
+            _llm_cache[key] = _build_llm(backend, model_name, temperature)
+        return _llm_cache[key]
+
+
+def _build_llm(backend, model_name, temperature):
+    """Construct a chat model for a backend"""
+    if backend == "fake":
+        return FakeTutorChatModel(
+            model_name=model_name,
+            latency=float(os.getenv("FAKE_LLM_LATENCY", 0.3)),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", 80)),
+        )
+    if backend != "openai":
+        raise ValueError(f"Unknown LLM_BACKEND: {backend}")
+
+    # Enough pooled keep-alive connections for many concurrent conversations in async mode
+    max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", 500))
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT", 60)), connect=10.0),
+    )
+    return ChatOpenAI(model_name=model_name, temperature=temperature, http_client=http_client)
+
+
+def _estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+FAKE_REPLIES = [
+    "¡Muy bien! 😊 Let's continue. What would you like to order today? (¿Qué le gustaría pedir hoy?)",
+    "Great effort! 🌟 Try saying: \"Quisiera una mesa para dos, por favor.\" (I would like a table for two, please.)",
+    "Perfect! Now, can you ask me how much it costs? Try: \"¿Cuánto cuesta?\" (How much does it cost?)",
+    "Nice! 👍 A common expression here is \"¡Buen provecho!\" (Enjoy your meal!). Can you use it in a sentence?",
+    "Good question! In many regions people greet with a kiss on the cheek. How would you introduce yourself?",
+]
+
+FAKE_MISTAKES = [
+    {
+        "mistake": "yo es",
+        "correction": "yo soy",
+        "explanation": "The verb 'ser' is conjugated as 'soy' in the first person singular.",
+        "rule": "Present tense conjugation of ser",
+        "category": "conjugation",
+        "examples": ["Yo soy estudiante.", "Yo soy de Canadá."],
+        "common_pitfalls": "Mixing up ser and estar."
+    },
+    {
+        "mistake": "la problema",
+        "correction": "el problema",
+        "explanation": "'Problema' is masculine despite ending in -a.",
+        "rule": "Noun gender exceptions",
+        "category": "articles/gender",
+        "examples": ["El problema es grave.", "El tema es interesante."],
+        "common_pitfalls": "Greek-origin nouns ending in -ma are masculine."
+    },
+    {
+        "mistake": "muy hambre",
+        "correction": "mucha hambre",
+        "explanation": "'Hambre' is a noun, so it takes 'mucha', not the adverb 'muy'.",
+        "rule": "Tener + noun expressions",
+        "category": "vocabulary",
+        "examples": ["Tengo mucha hambre.", "Tengo mucho frío."],
+        "common_pitfalls": "Translating 'very hungry' word for word."
+    },
+]
+
+
+class FakeTutorChatModel(BaseChatModel):
+    """Deterministic local stand-in for the chat model, for load tests and offline development"""
+
+    model_name: str = "fake-tutor"
+    latency: float = 0.3
+    tokens_per_second: float = 80.0
+
+    @property
+    def _llm_type(self):
+        return "fake-tutor"
+
+    def _respond(self, system, human):
+        """Pick a reply shaped like the real model's output for the prompt type"""
+        digest = int(hashlib.md5(human.encode("utf-8")).hexdigest(), 16)
+
+        if "Format your response as JSON" in system:
+            if digest % 3 == 0:
+                return json.dumps({
+                    "has_mistakes": True,
+                    "mistakes": [FAKE_MISTAKES[digest % len(FAKE_MISTAKES)]],
+                    "positive_feedback": "Good sentence structure.",
+                    "learning_tips": "Review verb conjugations."
+                }, ensure_ascii=False)
+            return json.dumps({
+                "has_mistakes": False,
+                "mistakes": [],
+                "positive_feedback": "Well done, no mistakes!",
+                "learning_tips": "Try using more varied vocabulary."
+            })
+
+        if "coach" in system:
+            return (
+                "🎯 Exercises: 1. Conjugate ser and estar daily. 2. Write five sentences about your day. "
+                "3. Practice gender with flashcards.\nResources: a spaced-repetition app, a grammar workbook.\n"
+                "💪 Keep going — every conversation makes you better!"
+            )
+
+        return FAKE_REPLIES[digest % len(FAKE_REPLIES)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        system = "\n".join(m.content for m in messages if isinstance(m, SystemMessage))
+        human = messages[-1].content if messages else ""
+        text = self._respond(system, human)
+
+        prompt_tokens = sum(_estimate_tokens(m.content) for m in messages)
+        completion_tokens = _estimate_tokens(text)
+
+        # Simulate time-to-first-token plus generation time
+        delay = self.latency
+        if self.tokens_per_second > 0:
+            delay += completion_tokens / self.tokens_per_second
+        if delay > 0:
+            time.sleep(delay)
+
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={
+                "token_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+                "model_name": self.model_name,
+            },
+        )
+
+    def _combine_llm_outputs(self, llm_outputs):
+        """Sum token usage across generations like ChatOpenAI does"""
+        totals = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        for output in llm_outputs:
+            if not output:
+                continue
+            for key, value in output.get("token_usage", {}).items():
+                totals[key] = totals.get(key, 0) + value
+        return {"token_usage": totals, "model_name": self.model_name}
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import http.cookiejar
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_MESSAGES = [
+    "Hola, quisiera una mesa para dos, por favor.",
+    "Yo es estudiante y tengo muy hambre.",
+    "¿Cuánto cuesta el menú del día?",
+    "La problema es que no tengo reserva.",
+    "Me gustaría pedir la paella y un agua.",
+    "¿Dónde está el baño?",
+    "Gracias, la comida estaba deliciosa.",
+]
+
+SCENARIOS = ["at a restaurant", "shopping at a store", "asking for directions", "meeting new people", "at a hotel"]
+LEVELS = ["beginner", "intermediate", "advanced"]
+
+
+class HttpLearnerClient:
+    """One simulated learner talking to a running server, with its own cookie jar"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, payload=None):
+        """Send a request and return the HTTP status code"""
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class InProcessLearnerClient:
+    """One simulated learner driving app.py through Flask's test client"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, payload=None):
+        """Send a request and return the HTTP status code"""
+        response = self.client.open(path, method=method, json=payload)
+        return response.status_code
+
+
+class LoadStats:
+    """Thread-safe per-endpoint latency and status collection"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, wall_time):
+        """Compute p50/p95/p99 latency and throughput per endpoint and overall"""
+        def percentiles(values):
+            values = sorted(values)
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            return {
+                "count": len(values),
+                "p50_ms": round(pick(0.50) * 1000, 2),
+                "p95_ms": round(pick(0.95) * 1000, 2),
+                "p99_ms": round(pick(0.99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+
+        endpoints = {}
+        all_latencies = []
+        for endpoint, values in self.latencies.items():
+            endpoints[endpoint] = percentiles(values)
+            endpoints[endpoint]["errors"] = self.errors.get(endpoint, 0)
+            all_latencies.extend(values)
+
+        return {
+            "wall_time_s": round(wall_time, 3),
+            "requests": len(all_latencies),
+            "requests_per_second": round(len(all_latencies) / wall_time, 2) if wall_time else 0.0,
+            "overall": percentiles(all_latencies) if all_latencies else {},
+            "endpoints": endpoints,
+        }
+
+
+def run_learner(client, stats, turns, learner_id, think_time):
+    """Drive one learner through start -> messages -> review -> end"""
+    rng = random.Random(learner_id)
+
+    def timed_request(endpoint, method, path, payload=None):
+        start = time.perf_counter()
+        try:
+            status = client.request(method, path, payload)
+        except Exception as e:
+            print(f"Learner {learner_id} {endpoint} failed: {str(e)}")
+            status = 599
+        stats.record(endpoint, time.perf_counter() - start, status)
+        return status
+
+    status = timed_request("start-session", "POST", "/api/start-session", {
+        "name": f"learner-{learner_id}",
+        "native_language": "English",
+        "learning_language": "Spanish",
+        "proficiency_level": rng.choice(LEVELS),
+        "scenario": rng.choice(SCENARIOS),
+    })
+    if status >= 400:
+        return
+
+    # The web client opens every conversation with a canned greeting
+    timed_request("send-message", "POST", "/api/send-message", {
+        "message": "Hello, I'm here to practice. Let's start the conversation.",
+        "initial": True,
+    })
+
+    for _ in range(turns):
+        timed_request("send-message", "POST", "/api/send-message", {"message": rng.choice(SAMPLE_MESSAGES)})
+        if think_time:
+            time.sleep(rng.uniform(0, think_time))
+
+    timed_request("get-review", "GET", "/api/get-review")
+    timed_request("end-session", "POST", "/api/end-session")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the language learning web API with simulated learners")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Base URL of a running server")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Drive app.py in this process with the fake LLM backend instead of over HTTP")
+    parser.add_argument("--learners", type=int, default=50, help="Number of simulated learners")
+    parser.add_argument("--concurrency", type=int, default=50, help="Learners running at the same time")
+    parser.add_argument("--turns", type=int, default=5, help="Messages sent by each learner")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between messages (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="HTTP timeout per request (s)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.in_process:
+        # Never hit the real provider, and keep synthetic learners out of the configured database
+        os.environ["LLM_BACKEND"] = "fake"
+        scratch = tempfile.mkdtemp(prefix="loadtest-")
+        os.environ["DATABASE_PATH"] = os.path.join(scratch, "loadtest.db")
+        os.environ["EVENT_LOG_DIR"] = os.path.join(scratch, "session_logs")
+        print(f"In-process run: fake LLM backend, database and session logs in {scratch}")
+        from app import app as flask_app
+        make_client = lambda: InProcessLearnerClient(flask_app)
+    else:
+        make_client = lambda: HttpLearnerClient(args.url, args.timeout)
+
+    stats = LoadStats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(run_learner, make_client(), stats, args.turns, learner_id, args.think_time)
+            for learner_id in range(args.learners)
+        ]
+        for future in futures:
+            future.result()
+    wall_time = time.perf_counter() - start
+
+    report = stats.summary(wall_time)
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import time
+import bisect
+import functools
+import threading
+
+
+def _latency_buckets(min_exponent=-4, max_exponent=2, sub_buckets=(1, 1.25, 1.5, 2, 2.5, 3, 4, 5, 6, 8)):
+    """Log-linear bucket upper bounds (HDR style): a few linear steps inside every decade"""
+    bounds = []
+    for exponent in range(min_exponent, max_exponent + 1):
+        for step in sub_buckets:
+            bounds.append(round(step * 10 ** exponent, 10))
+    return bounds
+
+
+LATENCY_BUCKETS = _latency_buckets()
+
+
+def _label_key(labels):
+    """Turn a labels dict into a hashable, consistently ordered key"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    """Render labels in Prometheus text format"""
+    items = list(label_key)
+    if extra:
+        items.extend(extra)
+    if not items:
+        return ""
+    escaped = []
+    for key, value in items:
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with constant-time recording"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one value"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket that contains it"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        """Return (cumulative bucket counts, count, sum) consistently"""
+        with self._lock:
+            cumulative = []
+            running = 0
+            for bucket_count in self.counts:
+                running += bucket_count
+                cumulative.append(running)
+            return cumulative, self.count, self.sum
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class MetricsRegistry:
+    """Process-wide collection of labelled histograms and counters"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text="", **labels):
+        """Get or create the histogram for name and labels"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+                self._help.setdefault(name, help_text)
+            return series[key]
+
+    def counter(self, name, help_text="", **labels):
+        """Get or create the counter for name and labels"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            if key not in series:
+                series[key] = Counter()
+                self._help.setdefault(name, help_text)
+            return series[key]
+
+    def observe(self, name, value, help_text="", **labels):
+        """Record a value on a labelled histogram"""
+        self.histogram(name, help_text, **labels).observe(value)
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        """Increment a labelled counter"""
+        self.counter(name, help_text, **labels).inc(amount)
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+
+        lines = []
+        for name in sorted(counters):
+            if self._help.get(name):
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, counter in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {counter.value}")
+
+        for name in sorted(histograms):
+            if self._help.get(name):
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(histograms[name].items()):
+                cumulative, count, total = histogram.snapshot()
+                for bound, bucket_total in zip(histogram.buckets, cumulative):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', repr(bound))])} {bucket_total}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {cumulative[-1]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry used by the bot, the database layer and the web app
+registry = MetricsRegistry()
+
+
+class timed:
+    """Time a block or function into a latency histogram, usable as a context manager or decorator"""
+
+    def __init__(self, name, help_text="", **labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = dict(self.labels)
+        labels["outcome"] = "error" if exc_type else "ok"
+        registry.observe(self.name, time.perf_counter() - self.start, self.help_text, **labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, self.help_text, **self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def instrument_methods(metric_name, help_text=""):
+    """Class decorator that times every public method into metric_name labelled by method"""
+    def decorate(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or not callable(value):
+                continue
+            setattr(cls, attr, timed(metric_name, help_text, method=attr)(value))
+        return cls
+    return decorate
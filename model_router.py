@@ -0,0 +1,41 @@
+import os
+from llm_backends import create_llm
+from metrics import registry
+
+# Tasks whose output is structured or short enough for the small model to handle most of the time
+ROUTABLE_TASKS = {"mistake_analysis", "suggestions"}
+
+
+class ModelRouter:
+    """Pick a fast or strong model per task and input, escalating when the fast model fails"""
+
+    def __init__(self, fast_model=None, strong_model=None, short_input_chars=None):
+        self.strong_model = strong_model or os.getenv("STRONG_MODEL") or os.getenv("LANGUAGE_MODEL", "gpt-3.5-turbo")
+        # Without FAST_MODEL every task stays on the strong model
+        self.fast_model = fast_model or os.getenv("FAST_MODEL") or self.strong_model
+        self.short_input_chars = short_input_chars or int(os.getenv("ROUTER_SHORT_INPUT_CHARS", 160))
+
+    def select_tier(self, task, text="", level=""):
+        """Return "fast" or "strong" for a task given its input and the learner's level"""
+        if task not in ROUTABLE_TASKS or self.fast_model == self.strong_model:
+            return "strong"
+        if level == "advanced":
+            # Subtle register and idiom errors need the larger model
+            return "strong"
+        if level == "beginner" or len(text) <= self.short_input_chars:
+            return "fast"
+        return "strong"
+
+    def model_for(self, tier):
+        return self.fast_model if tier == "fast" else self.strong_model
+
+    def route(self, task, text="", level=""):
+        """Return (tier, llm) for a task and record the decision"""
+        tier = self.select_tier(task, text, level)
+        registry.inc("model_router_decisions_total", 1, "Model routing decisions", task=task, tier=tier)
+        return tier, create_llm(self.model_for(tier))
+
+    def escalate(self, task):
+        """Return the strong model after the fast model's output failed validation"""
+        registry.inc("model_router_escalations_total", 1, "Fast-model outputs escalated to the strong model", task=task)
+        return create_llm(self.strong_model)
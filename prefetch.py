@@ -0,0 +1,120 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from langchain.chains import LLMChain
+from langchain.prompts import ChatPromptTemplate
+from metrics import registry
+from vocab_packs import LANGUAGE_ALIASES, SCENE_ALIASES, normalize
+from language_learning_bot import LanguageLearningBot, SCENES, PROFICIENCY_LEVELS
+
+# Background workers for speculative LLM calls (green threads in async mode)
+prefetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", 8)),
+    thread_name_prefix="prefetch"
+)
+
+
+# Pool keys come from client input, so only known profiles get a pool (web language codes and
+# scenario ids as well as the CLI's names)
+KNOWN_LANGUAGES = set(LANGUAGE_ALIASES) | set(LANGUAGE_ALIASES.values())
+KNOWN_SCENES = set(SCENE_ALIASES) | set(SCENE_ALIASES.values()) | {normalize(scene) for scene in SCENES.values()}
+KNOWN_LEVELS = set(PROFICIENCY_LEVELS)
+
+# Pool refills are made for no learner; their token usage is recorded under this user and session key
+POOL_ACCOUNT = "system"
+POOL_SESSION_KEY = "opener_pool"
+
+
+def opener_key(bot):
+    """Pool key for openers (everything the generic opening depends on), or None for an unknown profile"""
+    key = tuple(normalize(value or "") for value in
+                (bot.native_language, bot.learning_language, bot.proficiency_level, bot.selected_scene))
+    native, learning, level, scene = key
+    if native in KNOWN_LANGUAGES and learning in KNOWN_LANGUAGES and level in KNOWN_LEVELS and scene in KNOWN_SCENES:
+        return key
+    return None
+
+
+def generic_opener_factory(bot):
+    """Build a callable generating a non-personalized opener for the bot's profile
+
+    Calls run on a separate bot with the same profile and no session, so they never count against
+    (or degrade the model of) the learner whose session triggered the refill.
+    """
+    pool_bot = LanguageLearningBot()
+    for field in ("native_language", "learning_language", "proficiency_level", "selected_scene"):
+        setattr(pool_bot, field, getattr(bot, field))
+    pool_bot.user_name = POOL_ACCOUNT
+    pool_bot.session_key = POOL_SESSION_KEY
+    pool_bot.token_budget = 0
+    pool_bot.token_limit = 0
+    pool_bot.load_vocab_pack()
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", pool_bot.create_system_prompt(include_weaknesses=False)),
+        ("human", "{input}")
+    ])
+    chain = LLMChain(llm=pool_bot.llm, prompt=prompt, verbose=False)
+    opening_input = f"Hi! I'm here to practice {pool_bot.learning_language}."
+
+    def generate():
+        return pool_bot.run_chain(chain, {"input": opening_input}, "opener_pool")["text"]
+
+    return generate
+
+
+class OpenerPool:
+    """Precomputed scene openers per (native language, learning language, level, scene)"""
+
+    def __init__(self, size=None, ttl=None, executor=prefetch_executor):
+        self.size = size if size is not None else int(os.getenv("OPENER_POOL_SIZE", 3))
+        self.ttl = ttl if ttl is not None else int(os.getenv("OPENER_POOL_TTL", 3600))
+        self.executor = executor
+        self._openers = {}
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Pop a fresh opener for key, or None if the pool has none"""
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            openers = self._openers.get(key)
+            while openers:
+                created, text = openers.popleft()
+                if now - created < self.ttl:
+                    registry.inc("opener_pool_requests_total", 1, "Opener pool lookups", result="hit")
+                    return text
+        registry.inc("opener_pool_requests_total", 1, "Opener pool lookups", result="miss")
+        return None
+
+    def refill(self, key, bot):
+        """Top the pool for key back up in the background using the bot's profile"""
+        if key is None:
+            return
+        with self._lock:
+            if self.size <= 0 or key in self._refilling or len(self._openers.get(key, ())) >= self.size:
+                return
+            self._refilling.add(key)
+        self.executor.submit(self._refill, key, generic_opener_factory(bot))
+
+    def _refill(self, key, generate):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._openers.get(key, ())) >= self.size:
+                        return
+                text = generate()
+                with self._lock:
+                    self._openers.setdefault(key, deque()).append((time.time(), text))
+        except Exception as e:
+            print(f"Error refilling opener pool: {str(e)}")
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+
+opener_pool = OpenerPool()
@@ -0,0 +1,229 @@
+import os
+import sys
+import hmac
+import time
+import html
+import random
+import hashlib
+import threading
+from async_support import start_native_thread, native_sleep, native_thread_id, native_lock, current_greenlet
+
+# Frames from these files are bookkeeping, not part of the profiled request
+_SKIPPED_FILES = (os.path.abspath(__file__),)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse_stack(frame, root=None):
+    """Root-first "file:function" labels joined by semicolons (the collapsed-stack format),
+    starting at root when given so server frames above the request are left out"""
+    labels = []
+    while frame is not None:
+        if frame.f_code.co_filename not in _SKIPPED_FILES:
+            labels.append(_frame_label(frame))
+        if frame is root:
+            break
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class Capture:
+    """Wall-clock stack samples of one request, taken by a native thread every interval seconds"""
+
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = interval
+        self.counts = {}
+        self.profile_id = None
+        self.duration = 0.0
+        self._thread_id = native_thread_id()
+        # Under gevent a waiting greenlet is not the thread's current frame, so it is sampled directly
+        self._greenlet = current_greenlet()
+        self._running = False
+        # Held while one sample is taken, so __exit__ can stop the sampler between samples
+        self._sampling = native_lock()
+        self._started = None
+        self._root = None
+
+    def _current_frame(self):
+        if self._greenlet is not None and self._greenlet.gr_frame is not None:
+            return self._greenlet.gr_frame  # Suspended (waiting on I/O)
+        return sys._current_frames().get(self._thread_id)
+
+    def _sample(self, counts, root):
+        while True:
+            with self._sampling:
+                if not self._running:
+                    return
+                frame = self._current_frame()
+                if frame is not None:
+                    stack = collapse_stack(frame, root)
+                    counts[stack] = counts.get(stack, 0) + 1
+            native_sleep(self.interval)
+
+    def __enter__(self):
+        self._root = sys._getframe(1)
+        self._running = True
+        self._started = time.perf_counter()
+        start_native_thread(self._sample, self.counts, self._root)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Waits for at most one sample in progress; the sampler writes nothing after this
+        with self._sampling:
+            self._running = False
+        self.duration = time.perf_counter() - self._started
+        self.counts = dict(self.counts)
+        self._root = None
+        return False
+
+
+class ProfileStore:
+    """Collapsed-stack files named <time>-<name>-<duration>ms-<random>.folded, newest PROFILE_KEEP kept"""
+
+    def __init__(self, directory=None, keep=None):
+        self.directory = directory or os.getenv("PROFILE_DIR", "profiles")
+        self.keep = keep or int(os.getenv("PROFILE_KEEP", 500))
+        self._lock = threading.Lock()
+
+    def save(self, capture):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{int(time.time())}-{capture.name}-{int(capture.duration * 1000)}ms-{os.urandom(3).hex()}"
+        lines = [f"{stack} {count}\n" for stack, count in sorted(capture.counts.items())]
+        path = os.path.join(self.directory, profile_id + ".folded")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(path + ".tmp", path)
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        with self._lock:
+            for profile_id in self.list()[self.keep:]:
+                try:
+                    os.remove(self.path_for(profile_id))
+                except OSError:
+                    pass
+
+    def path_for(self, profile_id):
+        if os.path.basename(profile_id) != profile_id or profile_id.startswith("."):
+            raise ValueError(f"Invalid profile id: {profile_id}")
+        return os.path.join(self.directory, profile_id + ".folded")
+
+    def list(self, name=None):
+        """Profile ids, newest first, optionally only those of one request name"""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [f[:-len(".folded")] for f in files if f.endswith(".folded")]
+        if name:
+            ids = [profile_id for profile_id in ids if profile_id.split("-")[1] == name]
+        return sorted(ids, reverse=True)
+
+    def load(self, profile_id):
+        counts = {}
+        with open(self.path_for(profile_id), encoding="utf-8") as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    counts[stack] = counts.get(stack, 0) + int(count)
+        return counts
+
+    def merge(self, profile_ids):
+        """Sum several profiles, e.g. the last 50 send_message requests"""
+        counts = {}
+        for profile_id in profile_ids:
+            try:
+                for stack, count in self.load(profile_id).items():
+                    counts[stack] = counts.get(stack, 0) + count
+            except FileNotFoundError:
+                pass  # Pruned meanwhile
+        return counts
+
+
+class Profiler:
+    """Decides which requests are profiled: a sampled fraction, or any request carrying PROFILE_TOKEN"""
+
+    def __init__(self, sample_rate=None, token=None, interval=None, store=None):
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+        self.token = token if token is not None else os.getenv("PROFILE_TOKEN", "")
+        self.interval = interval or float(os.getenv("PROFILE_INTERVAL", 0.005))
+        self.store = store or ProfileStore()
+
+    def authorized(self, token):
+        """Whether a token grants on-demand profiling and the admin endpoints (never without PROFILE_TOKEN)"""
+        return bool(self.token) and bool(token) and hmac.compare_digest(token, self.token)
+
+    def wants(self, header_token):
+        return self.authorized(header_token) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def capture(self, name):
+        return Capture(name, self.interval)
+
+    def save(self, capture):
+        try:
+            capture.profile_id = self.store.save(capture)
+        except Exception as e:
+            print(f"Error saving profile: {str(e)}")
+        return capture.profile_id
+
+
+def _color(label):
+    """Stable warm color per function, as in classic flame graphs"""
+    digest = hashlib.blake2b(label.encode("utf-8"), digest_size=3).digest()
+    return f"rgb({205 + digest[0] % 50},{digest[1] % 230},{digest[2] % 55})"
+
+
+def render_flamegraph(counts, title="Flame graph", width=1200, row_height=16):
+    """Render collapsed stacks as a static SVG flame graph (hover a frame for its sample share)"""
+    root = {"children": {}, "value": 0}
+    for stack, count in counts.items():
+        root["value"] += count
+        node = root
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"children": {}, "value": 0})
+            node["value"] += count
+
+    total = root["value"] or 1
+    rects = []
+    max_depth = 0
+
+    def layout(node, x, depth):
+        nonlocal max_depth
+        for label, child in sorted(node["children"].items()):
+            child_width = child["value"] / total * width
+            if child_width >= 0.5:
+                max_depth = max(max_depth, depth)
+                rects.append((label, child["value"], x, depth, child_width))
+                layout(child, x, depth + 1)
+            x += child_width
+
+    layout(root, 0.0, 0)
+    graph_top = 30
+    height = graph_top + (max_depth + 1) * row_height + 10
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Verdana, sans-serif" font-size="11">',
+        f'<rect width="100%" height="100%" fill="#f8f8f8"/>',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="15">'
+        f'{html.escape(title)} ({root["value"]} samples)</text>',
+    ]
+    for label, value, x, depth, rect_width in rects:
+        y = height - 10 - (depth + 1) * row_height
+        share = value / total * 100
+        text = ""
+        if rect_width > 35:
+            shown = label if len(label) * 7 < rect_width - 6 else label[:max(int((rect_width - 6) / 7) - 2, 1)] + ".."
+            text = f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{html.escape(shown)}</text>'
+        parts.append(
+            f'<g><title>{html.escape(label)} ({value} samples, {share:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{rect_width:.1f}" height="{row_height - 1}" '
+            f'fill="{_color(label)}" rx="2"/>{text}</g>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
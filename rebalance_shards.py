@@ -0,0 +1,160 @@
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+from db_manager import MistakeTracker, INTERNED_MISTAKE_FIELDS
+from sharding import shard_for, shard_paths
+
+# Per-user tables in copy order (sessions first so progress rows can point at the new session ids)
+USER_TABLES = [
+    "sessions", "mistakes", "vocabulary_learned", "progress_tracking", "weakness_profiles", "token_usage",
+    "mistake_monthly_summary", "session_monthly_summary", "event_log_checkpoints",
+]
+
+
+def _columns(conn, table):
+    cursor = conn.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+class ShardMover:
+    """Copies one user's rows from a source shard to a destination shard, remapping ids"""
+
+    def __init__(self, source, destination):
+        self.source = source
+        self.destination = destination
+        self._languages = {}
+        self._categories = {}
+        self._texts = {}
+
+    def _lookup_name(self, table, row_id):
+        cursor = self.source.conn.execute(f"SELECT name FROM {table} WHERE id = ?", (row_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _map_language(self, language_id):
+        if language_id is None:
+            return None
+        if language_id not in self._languages:
+            name = self._lookup_name("languages", language_id)
+            self._languages[language_id] = self.destination.get_or_create_language(name) if name else None
+        return self._languages[language_id]
+
+    def _map_category(self, category_id):
+        if category_id is None:
+            return None
+        if category_id not in self._categories:
+            name = self._lookup_name("mistake_categories", category_id)
+            self._categories[category_id] = self.destination.get_or_create_category(name) if name else None
+        return self._categories[category_id]
+
+    def _map_text(self, text_id):
+        if text_id is None:
+            return None
+        if text_id not in self._texts:
+            cursor = self.source.conn.execute("SELECT content FROM text_content WHERE id = ?", (text_id,))
+            row = cursor.fetchone()
+            self._texts[text_id] = self.destination.intern_text(row[0]) if row else None
+        return self._texts[text_id]
+
+    def move_user(self, user_id, user_name):
+        """Copy every row of the user to the destination, then delete it from the source"""
+        source, destination = self.source.conn, self.destination.conn
+        new_user_id = self.destination.get_or_create_user(user_name)
+        session_ids = {}
+
+        remaps = {
+            "user_id": lambda value: new_user_id,
+            "language_id": self._map_language,
+            "category_id": self._map_category,
+            "session_id": lambda value: session_ids.get(value),
+        }
+        for field in INTERNED_MISTAKE_FIELDS:
+            remaps[f"{field}_id"] = self._map_text
+
+        for table in USER_TABLES:
+            source_columns = _columns(source, table)
+            columns = [c for c in source_columns if c != "id" and c in set(_columns(destination, table))]
+            # Tables keyed by (user, ...) rather than an id replace any stale row of the user
+            verb = "INSERT" if "id" in source_columns else "INSERT OR REPLACE"
+
+            cursor = source.execute(f"SELECT {', '.join(source_columns)} FROM {table} WHERE user_id = ?", (user_id,))
+            for row in cursor.fetchall():
+                record = dict(zip(source_columns, row))
+                values = [remaps[c](record[c]) if c in remaps else record[c] for c in columns]
+                inserted = destination.execute(
+                    f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    values
+                )
+                if table == "sessions":
+                    session_ids[record["id"]] = inserted.lastrowid
+
+        # Commit the copy before deleting, so an interruption can only leave duplicates, never lose data
+        destination.commit()
+
+        for table in USER_TABLES:
+            source.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+        source.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        source.commit()
+
+
+def rebalance(database_path, from_shards, to_shards, dry_run=False):
+    """Move every user to the shard it belongs to under the new shard count"""
+    source_paths = shard_paths(database_path, from_shards)
+    destination_paths = shard_paths(database_path, to_shards)
+    trackers = {}
+
+    def tracker_for(path):
+        if path not in trackers:
+            trackers[path] = MistakeTracker(path)
+        return trackers[path]
+
+    moved = 0
+    kept = 0
+    try:
+        for source_path in source_paths:
+            if not os.path.exists(source_path):
+                continue
+            source = tracker_for(source_path)
+            users = source.conn.execute("SELECT id, name FROM users").fetchall()
+
+            for user_id, user_name in users:
+                destination_path = destination_paths[shard_for(user_name, to_shards)]
+                if destination_path == source_path:
+                    kept += 1
+                    continue
+                moved += 1
+                if not dry_run:
+                    ShardMover(source, tracker_for(destination_path)).move_user(user_id, user_name)
+
+        if not dry_run:
+            for path in source_paths:
+                # Give the space freed by moved users back to the filesystem
+                if path in trackers and path not in destination_paths:
+                    trackers[path].conn.execute("VACUUM")
+    finally:
+        for tracker in trackers.values():
+            tracker.close()
+
+    return moved, kept
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Move learners between SQLite shards after changing DB_SHARDS. Stop the app first."
+    )
+    parser.add_argument("--database-path", default=os.getenv("DATABASE_PATH", "language_learning.db"))
+    parser.add_argument("--from-shards", type=int, required=True, help="Current shard count")
+    parser.add_argument("--to-shards", type=int, required=True, help="New shard count")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many users would move")
+    args = parser.parse_args()
+
+    moved, kept = rebalance(args.database_path, args.from_shards, args.to_shards, args.dry_run)
+    action = "Would move" if args.dry_run else "Moved"
+    print(f"{action} {moved} users; {kept} users already on their shard")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
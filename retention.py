@@ -0,0 +1,260 @@
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import threading
+from dotenv import load_dotenv
+from db_manager import MistakeTracker
+from sharding import shard_paths
+from async_support import run_blocking
+
+try:
+    import fcntl
+except ImportError:  # Windows: the in-app scheduler runs without a cross-process lock
+    fcntl = None
+
+MISTAKE_ARCHIVE_QUERY = '''
+SELECT m.id, m.user_id, m.language_id, m.category_id, strftime('%Y-%m', m.timestamp),
+       u.name, l.name, mc.name, m.mistake, m.correction, m.timestamp,
+       COALESCE(e.content, m.explanation), COALESCE(r.content, m.rule),
+       COALESCE(x.content, m.examples), COALESCE(p.content, m.common_pitfalls)
+FROM mistakes m
+LEFT JOIN users u ON m.user_id = u.id
+LEFT JOIN languages l ON m.language_id = l.id
+LEFT JOIN mistake_categories mc ON m.category_id = mc.id
+LEFT JOIN text_content e ON m.explanation_id = e.id
+LEFT JOIN text_content r ON m.rule_id = r.id
+LEFT JOIN text_content x ON m.examples_id = x.id
+LEFT JOIN text_content p ON m.common_pitfalls_id = p.id
+WHERE m.timestamp < datetime('now', ?)
+ORDER BY m.timestamp
+LIMIT ?
+'''
+
+SESSION_ARCHIVE_QUERY = '''
+SELECT s.id, s.user_id, s.language_id, strftime('%Y-%m', s.start_time),
+       u.name, l.name, s.proficiency_level, s.scene, s.start_time, s.end_time,
+       s.total_interactions, s.mistake_count, s.vocabulary_learned, s.learning_streak, s.accuracy_rate
+FROM sessions s
+LEFT JOIN users u ON s.user_id = u.id
+LEFT JOIN languages l ON s.language_id = l.id
+WHERE s.start_time < datetime('now', ?) AND s.end_time IS NOT NULL
+  AND s.id NOT IN (SELECT session_id FROM progress_tracking WHERE session_id IS NOT NULL)
+ORDER BY s.start_time
+LIMIT ?
+'''
+
+
+class RetentionJob:
+    """Roll old mistakes and sessions into monthly summaries, archive the raw rows, and reclaim space"""
+
+    def __init__(self, archive_dir=None, retention_days=None, batch_size=None, vacuum_pages=None):
+        self.archive_dir = archive_dir or os.getenv("RETENTION_ARCHIVE_DIR", "archive")
+        self.retention_days = retention_days or int(os.getenv("RETENTION_DAYS", 365))
+        self.batch_size = batch_size or int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+        self.vacuum_pages = vacuum_pages or int(os.getenv("RETENTION_VACUUM_PAGES", 2000))
+
+    @property
+    def cutoff(self):
+        return f"-{self.retention_days} days"
+
+    def _archive(self, tracker, table, month, records):
+        """Append records to the month's gzip archive (one gzip member per batch) and fsync it"""
+        directory = os.path.join(self.archive_dir, os.path.splitext(os.path.basename(tracker.db_name))[0])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{table}-{month}.jsonl.gz")
+        with open(path, "ab") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb") as archive:
+                for record in records:
+                    archive.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def roll_up_mistakes(self, tracker):
+        """Archive and summarize mistakes older than the cutoff, one short transaction per batch"""
+        conn = tracker.conn
+        moved = 0
+        while True:
+            rows = conn.execute(MISTAKE_ARCHIVE_QUERY, (self.cutoff, self.batch_size)).fetchall()
+            if not rows:
+                return moved
+
+            by_month = {}
+            counts = {}
+            for (row_id, user_id, language_id, category_id, month, user, language, category,
+                 mistake, correction, timestamp, explanation, rule, examples, pitfalls) in rows:
+                by_month.setdefault(month, []).append({
+                    "user": user, "language": language, "category": category,
+                    "mistake": mistake, "correction": correction, "timestamp": timestamp,
+                    "explanation": explanation, "rule": rule, "examples": examples, "common_pitfalls": pitfalls,
+                })
+                key = (user_id, language_id, category_id, month)
+                counts[key] = counts.get(key, 0) + 1
+
+            # Archive first: a crash before the commit only leaves rows archived twice, never lost
+            for month, records in by_month.items():
+                self._archive(tracker, "mistakes", month, records)
+
+            conn.executemany('''
+            INSERT INTO mistake_monthly_summary (user_id, language_id, category_id, month, mistake_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, language_id, category_id, month)
+            DO UPDATE SET mistake_count = mistake_count + excluded.mistake_count
+            ''', [key + (count,) for key, count in counts.items()])
+            conn.executemany("DELETE FROM mistakes WHERE id = ?", [(row[0],) for row in rows])
+            conn.commit()
+            moved += len(rows)
+
+    def roll_up_sessions(self, tracker):
+        """Archive and summarize ended sessions older than the cutoff"""
+        conn = tracker.conn
+        moved = 0
+        while True:
+            rows = conn.execute(SESSION_ARCHIVE_QUERY, (self.cutoff, self.batch_size)).fetchall()
+            if not rows:
+                return moved
+
+            by_month = {}
+            totals = {}
+            for (row_id, user_id, language_id, month, user, language, level, scene, start_time, end_time,
+                 interactions, mistakes, vocabulary, streak, accuracy) in rows:
+                by_month.setdefault(month, []).append({
+                    "user": user, "language": language, "proficiency_level": level, "scene": scene,
+                    "start_time": start_time, "end_time": end_time, "total_interactions": interactions,
+                    "mistake_count": mistakes, "vocabulary_learned": vocabulary,
+                    "learning_streak": streak, "accuracy_rate": accuracy,
+                })
+                entry = totals.setdefault((user_id, language_id, month), [0, 0, 0, 0, 0.0])
+                entry[0] += 1
+                entry[1] += interactions or 0
+                entry[2] += mistakes or 0
+                entry[3] += vocabulary or 0
+                entry[4] += accuracy or 0.0
+
+            for month, records in by_month.items():
+                self._archive(tracker, "sessions", month, records)
+
+            conn.executemany('''
+            INSERT INTO session_monthly_summary (user_id, language_id, month, session_count,
+                                                 total_interactions, mistake_count, vocabulary_learned, accuracy_sum)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, language_id, month) DO UPDATE SET
+                session_count = session_count + excluded.session_count,
+                total_interactions = total_interactions + excluded.total_interactions,
+                mistake_count = mistake_count + excluded.mistake_count,
+                vocabulary_learned = vocabulary_learned + excluded.vocabulary_learned,
+                accuracy_sum = accuracy_sum + excluded.accuracy_sum
+            ''', [key + tuple(values) for key, values in totals.items()])
+            conn.executemany("DELETE FROM sessions WHERE id = ?", [(row[0],) for row in rows])
+            conn.commit()
+            moved += len(rows)
+
+    def prune_texts(self, tracker):
+        """Delete interned texts no mistake references any more (only while the app is stopped:
+        running trackers cache text ids)"""
+        cursor = tracker.conn.execute('''
+        DELETE FROM text_content WHERE id NOT IN (
+            SELECT explanation_id FROM mistakes WHERE explanation_id IS NOT NULL
+            UNION SELECT rule_id FROM mistakes WHERE rule_id IS NOT NULL
+            UNION SELECT examples_id FROM mistakes WHERE examples_id IS NOT NULL
+            UNION SELECT common_pitfalls_id FROM mistakes WHERE common_pitfalls_id IS NOT NULL
+        )
+        ''')
+        tracker.conn.commit()
+        return cursor.rowcount
+
+    def maintain(self, tracker, full_vacuum=False):
+        """Return free pages to the filesystem a little at a time and refresh query planner statistics"""
+        conn = tracker.conn
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # executescript steps the pragma to completion (execute() frees a single page)
+            conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+        elif full_vacuum:
+            # One-time conversion of a database created before incremental vacuum was enabled
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        # Sampled ANALYZE keeps this cheap on large tables
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    def run(self, tracker, full_vacuum=False, prune_texts=False):
+        """Run every retention step on one database; returns what was done"""
+        started = time.perf_counter()
+        result = {
+            "database": tracker.db_name,
+            "mistakes_archived": self.roll_up_mistakes(tracker),
+            "sessions_archived": self.roll_up_sessions(tracker),
+        }
+        if prune_texts:
+            result["texts_pruned"] = self.prune_texts(tracker)
+        self.maintain(tracker, full_vacuum)
+        result["seconds"] = round(time.perf_counter() - started, 2)
+        return result
+
+
+class RetentionScheduler:
+    """Runs retention in the app every RETENTION_INTERVAL seconds, in one worker per host at a time"""
+
+    def __init__(self, job=None, interval=None):
+        self.job = job or RetentionJob()
+        self.interval = interval if interval is not None else float(os.getenv("RETENTION_INTERVAL", 0))
+        self._worker = None
+
+    def start(self, sharded_tracker):
+        if not self.interval or self._worker is not None:
+            return
+        self._worker = threading.Thread(target=self._run, args=(sharded_tracker,), name="retention", daemon=True)
+        self._worker.start()
+
+    def _run(self, sharded_tracker):
+        os.makedirs(self.job.archive_dir, exist_ok=True)
+        lock_path = os.path.join(self.job.archive_dir, ".retention.lock")
+        while True:
+            time.sleep(self.interval)
+            with open(lock_path, "w") as lock_file:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # Another worker is running it
+                for pool in sharded_tracker.pools:
+                    try:
+                        with pool.connection() as tracker:
+                            # SQLite work would otherwise block every other greenlet in async mode
+                            print(f"Retention: {run_blocking(self.job.run, tracker)}")
+                    except Exception as e:
+                        print(f"Error running retention on {pool.db_path}: {str(e)}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Archive old mistakes and sessions into monthly summaries and compressed files, then vacuum"
+    )
+    parser.add_argument("--database-path", default=os.getenv("DATABASE_PATH", "language_learning.db"))
+    parser.add_argument("--shards", type=int, default=int(os.getenv("DB_SHARDS", 1)))
+    parser.add_argument("--days", type=int, help="Keep raw rows this many days (default RETENTION_DAYS or 365)")
+    parser.add_argument("--archive-dir", help="Where compressed archives go (default RETENTION_ARCHIVE_DIR)")
+    parser.add_argument("--full-vacuum", action="store_true",
+                        help="Convert databases created without incremental vacuum (rewrites the file; stop the app)")
+    parser.add_argument("--prune-texts", action="store_true",
+                        help="Also delete unreferenced interned texts (stop the app first)")
+    args = parser.parse_args()
+
+    job = RetentionJob(archive_dir=args.archive_dir, retention_days=args.days)
+    for path in shard_paths(args.database_path, args.shards):
+        if not os.path.exists(path):
+            continue
+        tracker = MistakeTracker(path)
+        try:
+            print(json.dumps(job.run(tracker, args.full_vacuum, args.prune_texts)))
+        finally:
+            tracker.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import os
+import queue
+import atexit
+import hashlib
+import threading
+from contextlib import contextmanager
+from db_manager import MistakeTracker, TOKEN_USAGE_BATCH_SIZE, SESSION_STATS_BATCH_SIZE
+from async_support import run_blocking
+
+# MistakeTracker methods whose first argument is the user name, routed to that user's shard
+USER_ROUTED_METHODS = {
+    "get_or_create_user",
+    "get_weakness_profile",
+    "rebuild_weakness_profile",
+    "get_user_mistakes",
+    "get_user_mistake_details",
+    "get_mistake_stats_by_category",
+    "get_monthly_mistake_counts",
+    "save_session_stats",
+    "track_vocabulary",
+    "update_vocabulary_usage",
+    "get_user_progress",
+    "get_event_log_offset",
+}
+
+
+def shard_for(user_name, num_shards):
+    """Stable shard index for a user (Python's hash() is randomized per process)"""
+    digest = hashlib.blake2b(user_name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+def shard_paths(database_path, num_shards):
+    """Database files for a shard count; a single shard keeps the original file"""
+    if num_shards == 1:
+        return [database_path]
+    base, ext = os.path.splitext(database_path)
+    return [f"{base}.shard{i}{ext or '.db'}" for i in range(num_shards)]
+
+
+class ShardPool:
+    """Fixed-size pool of MistakeTracker connections to one shard file"""
+
+    def __init__(self, db_path, size):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue()
+        self._all = []
+        for _ in range(size):
+            tracker = MistakeTracker(db_path, check_same_thread=False)
+            # WAL lets readers proceed while another pooled connection writes
+            tracker.conn.execute("PRAGMA journal_mode = WAL")
+            tracker.conn.execute("PRAGMA busy_timeout = 5000")
+            self._all.append(tracker)
+            self._idle.put(tracker)
+
+    @contextmanager
+    def connection(self):
+        tracker = self._idle.get()
+        try:
+            yield tracker
+        except BaseException:
+            # A connection must not go back to the pool holding an open write transaction (and the shard's lock)
+            if tracker.conn.in_transaction:
+                tracker.rollback()
+            raise
+        finally:
+            self._idle.put(tracker)
+
+    def close(self):
+        for tracker in self._all:
+            tracker.close()
+
+
+class ShardedMistakeTracker:
+    """MistakeTracker interface over N SQLite files, sharded by user name"""
+
+    def __init__(self, database_path="language_learning.db", num_shards=1, pool_size=4):
+        self.num_shards = num_shards
+        self.pools = [ShardPool(path, pool_size) for path in shard_paths(database_path, num_shards)]
+        # Token usage is buffered per shard so a batch is written through one pooled connection
+        self._token_buffers = [[] for _ in range(num_shards)]
+        self._token_lock = threading.Lock()
+        # Session counters are buffered per shard by local session id
+        self._session_stats = [{} for _ in range(num_shards)]
+        self._session_stats_lock = threading.Lock()
+        # Called with (user_name, language_name) once new mistakes are committed
+        self.mistake_listeners = []
+
+    def pool_for(self, user_name):
+        return self.pools[shard_for(user_name, self.num_shards)]
+
+    def _on_shard(self, shard, work):
+        """Run work(tracker) on a pooled connection of a shard; under gevent in a real thread,
+        since SQLite calls would otherwise block every other greenlet"""
+        def call():
+            with self.pools[shard].connection() as tracker:
+                return work(tracker)
+        return run_blocking(call)
+
+    def __getattr__(self, name):
+        if name not in USER_ROUTED_METHODS:
+            raise AttributeError(name)
+
+        def routed(user_name, *args, **kwargs):
+            return self._on_shard(
+                shard_for(user_name, self.num_shards),
+                lambda tracker: getattr(tracker, name)(user_name, *args, **kwargs)
+            )
+        return routed
+
+    def add_mistake(self, user_name, language_name, *args, **kwargs):
+        """Add a mistake on the user's shard"""
+        self._on_shard(
+            shard_for(user_name, self.num_shards),
+            lambda tracker: tracker.add_mistake(user_name, language_name, *args, **kwargs)
+        )
+        for listener in self.mistake_listeners:
+            listener(user_name, language_name)
+
+    def add_logged_events(self, user_name, language_name, *args):
+        """Write a session's logged events and checkpoint on the user's shard"""
+        written = self._on_shard(
+            shard_for(user_name, self.num_shards),
+            lambda tracker: tracker.add_logged_events(user_name, language_name, *args)
+        )
+        if written:
+            for listener in self.mistake_listeners:
+                listener(user_name, language_name)
+        return written
+
+    # Sessions: the shard is encoded in the session id so end_session needs no user name
+
+    def start_session(self, user_name, language_name, proficiency_level, scene):
+        """Start a session on the user's shard and return a globally unique session id"""
+        shard = shard_for(user_name, self.num_shards)
+        local_id = self._on_shard(
+            shard, lambda tracker: tracker.start_session(user_name, language_name, proficiency_level, scene)
+        )
+        return local_id * self.num_shards + shard
+
+    def end_session(self, session_id, mistake_count, *args, **kwargs):
+        """End a session on the shard encoded in its id"""
+        local_id, shard = divmod(session_id, self.num_shards)
+        with self._session_stats_lock:
+            self._session_stats[shard].pop(local_id, None)
+        self._on_shard(shard, lambda tracker: tracker.end_session(local_id, mistake_count, *args, **kwargs))
+    
+    def record_session_stats(self, session_id, *stats):
+        """Buffer a session's running counters on its shard; sessions are updated in batches"""
+        local_id, shard = divmod(session_id, self.num_shards)
+        with self._session_stats_lock:
+            buffered = self._session_stats[shard]
+            buffered[local_id] = stats
+            if len(buffered) < SESSION_STATS_BATCH_SIZE:
+                return
+            self._session_stats[shard] = {}
+        self._write_session_stats(shard, buffered)
+    
+    def _write_session_stats(self, shard, buffered):
+        def write(tracker):
+            for local_id, stats in buffered.items():
+                tracker.record_session_stats(local_id, *stats)
+            tracker.flush_session_stats()
+        self._on_shard(shard, write)
+    
+    def flush_session_stats(self):
+        """Write buffered session counters on every shard"""
+        with self._session_stats_lock:
+            buffers, self._session_stats = self._session_stats, [{} for _ in range(self.num_shards)]
+        for shard, buffered in enumerate(buffers):
+            if buffered:
+                self._write_session_stats(shard, buffered)
+
+    # Cross-shard fan-out
+
+    def add_mistakes(self, rows):
+        """Add a batch of mistakes (rows start with the user name) with one transaction per shard"""
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(shard_for(row[0], self.num_shards), []).append(row)
+        for shard, shard_rows in by_shard.items():
+            self._on_shard(shard, lambda tracker: tracker.add_mistakes(shard_rows))
+        for user_name, language_name in {(row[0], row[1]) for row in rows}:
+            for listener in self.mistake_listeners:
+                listener(user_name, language_name)
+
+    def add_job_mistakes(self, job_key, next_index, rows):
+        """Add a batch job's mistakes; each shard commits its rows with its own record of the job's progress"""
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(shard_for(row[0], self.num_shards), []).append(row)
+        for shard, shard_rows in by_shard.items():
+            written = self._on_shard(shard, lambda tracker: tracker.add_job_mistakes(job_key, next_index, shard_rows))
+            if written:
+                for user_name, language_name in {(row[0], row[1]) for row in shard_rows}:
+                    for listener in self.mistake_listeners:
+                        listener(user_name, language_name)
+
+    def _shards_for_users(self, user_names):
+        """Group user names by shard (all shards when no users are given)"""
+        if not user_names:
+            return {index: None for index in range(self.num_shards)}
+        grouped = {}
+        for name in user_names:
+            grouped.setdefault(shard_for(name, self.num_shards), []).append(name)
+        return grouped
+
+    def fetch_mistake_rows(self, user_names=None, language_name=None, since=None):
+        """Fan out bulk mistake row fetches to the shards holding the users"""
+        rows = []
+        for shard, names in self._shards_for_users(user_names).items():
+            rows.extend(self._on_shard(shard, lambda tracker: tracker.fetch_mistake_rows(names, language_name, since)))
+        return rows
+
+    def fetch_session_rows(self, user_names=None, language_name=None, since=None):
+        """Fan out bulk session row fetches and merge them in start time order"""
+        rows = []
+        for shard, names in self._shards_for_users(user_names).items():
+            rows.extend(self._on_shard(shard, lambda tracker: tracker.fetch_session_rows(names, language_name, since)))
+        rows.sort(key=lambda row: row[1] or 0)
+        return rows
+
+    def get_token_usage(self, user_name=None, session_key=None):
+        """Token usage totals by (model, task), merged across shards when no user is given"""
+        self.flush_token_usage()
+        shards = [shard_for(user_name, self.num_shards)] if user_name else range(self.num_shards)
+        totals = {}
+        for shard in shards:
+            usage = self._on_shard(shard, lambda tracker: tracker.get_token_usage(user_name, session_key))
+            for model, task, calls, prompt, completion, cost in usage:
+                entry = totals.setdefault((model, task), [0, 0, 0, 0.0])
+                entry[0] += calls or 0
+                entry[1] += prompt or 0
+                entry[2] += completion or 0
+                entry[3] += cost or 0.0
+        rows = [(model, task) + tuple(values) for (model, task), values in totals.items()]
+        rows.sort(key=lambda row: row[3] + row[4], reverse=True)
+        return rows
+
+    def record_token_usage(self, user_name, *args):
+        """Buffer one LLM call's token usage on the user's shard; rows are written in batches"""
+        shard = shard_for(user_name, self.num_shards)
+        with self._token_lock:
+            buffered = self._token_buffers[shard]
+            buffered.append((user_name,) + args)
+            if len(buffered) < TOKEN_USAGE_BATCH_SIZE:
+                return
+            self._token_buffers[shard] = []
+        self._write_token_usage(shard, buffered)
+
+    def _write_token_usage(self, shard, rows):
+        def write(tracker):
+            for row in rows:
+                tracker.record_token_usage(*row)
+            tracker.flush_token_usage()
+        self._on_shard(shard, write)
+
+    def flush_token_usage(self):
+        """Write buffered token usage on every shard"""
+        with self._token_lock:
+            buffers, self._token_buffers = self._token_buffers, [[] for _ in range(self.num_shards)]
+        for shard, rows in enumerate(buffers):
+            if rows:
+                self._write_token_usage(shard, rows)
+
+    def close(self):
+        self.flush_token_usage()
+        self.flush_session_stats()
+        for pool in self.pools:
+            pool.close()
+
+
+_shared_tracker = None
+_shared_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Process-wide sharded tracker configured by DATABASE_PATH, DB_SHARDS and DB_POOL_SIZE"""
+    global _shared_tracker
+    with _shared_tracker_lock:
+        if _shared_tracker is None:
+            _shared_tracker = ShardedMistakeTracker(
+                os.getenv("DATABASE_PATH", "language_learning.db"),
+                num_shards=int(os.getenv("DB_SHARDS", 1)),
+                pool_size=int(os.getenv("DB_POOL_SIZE", 4)),
+            )
+            # Buffered token usage and session counters of unfinished sessions are written on exit
+            atexit.register(_shared_tracker.close)
+        return _shared_tracker
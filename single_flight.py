@@ -0,0 +1,76 @@
+import os
+import hashlib
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "abandoned")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Set when the leader was interrupted (e.g. its greenlet was killed) rather than failing
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Share one execution of a function among concurrent callers using the same key"""
+
+    def __init__(self, enabled=None):
+        self.enabled = enabled if enabled is not None else os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return (result, shared): shared is True when another caller's in-flight call was reused"""
+        if not self.enabled:
+            return func(), False
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+
+            call.done.wait()
+            if call.abandoned:
+                # The leader's interruption is not this caller's: run the call again
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.abandoned = True
+            raise
+        finally:
+            # Later callers start a new call; only requests overlapping this one share it
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def prompt_key(chain, inputs):
+    """Identity of an LLM chain call: model settings plus the fully rendered prompt"""
+    llm = chain.llm
+    parts = [
+        type(llm).__name__,
+        str(getattr(llm, "model_name", "")),
+        str(getattr(llm, "temperature", "")),
+        chain.prompt.format(**inputs),
+    ]
+    return hashlib.blake2b("\x00".join(parts).encode("utf-8"), digest_size=16).digest()
+
+
+# Identical LLM calls in flight at the same time (e.g. a class starting the same scenario) share one request
+llm_calls = SingleFlight()
@@ -122,7 +122,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Send initial message to start conversation
     function sendInitialMessage() {
         const initialMessage = {
-            message: "Hello, I'm here to practice. Let's start the conversation."
+            message: "Hello, I'm here to practice. Let's start the conversation.",
+            initial: true
         };
         
         loadingOverlay.classList.add('active');
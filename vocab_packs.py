@@ -0,0 +1,234 @@
+import os
+import re
+import mmap
+import struct
+import hashlib
+import threading
+
+# File layout (little endian):
+#   header     magic, version, pack count
+#   directory  one entry per (language, native language, scene, level) pack
+#   per pack   records in source order, then a hash-sorted lookup table
+#   strings    pack keys
+MAGIC = b"VPAK"
+# Version 2 keys packs by native language too (translations and explanations are written in it)
+VERSION = 2
+HEADER = struct.Struct("<4sHH")
+# key offset, key length, records start, records end, table offset, table entries, longest term in words
+DIRECTORY_ENTRY = struct.Struct("<7I")
+# term hash, record offset
+TABLE_ENTRY = struct.Struct("<QI")
+# kind, string count; each string is a u16 length followed by UTF-8 bytes
+RECORD_HEADER = struct.Struct("<BB")
+STRING_LENGTH = struct.Struct("<H")
+
+KIND_WORD = 0
+KIND_PHRASE = 1
+KIND_MISTAKE = 2
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# The web client sends language codes and short scenario ids; packs are keyed by the CLI's names
+LANGUAGE_ALIASES = {
+    "en": "english", "es": "spanish", "fr": "french", "de": "german", "it": "italian",
+    "pt": "portuguese", "ru": "russian", "zh": "chinese", "ja": "japanese", "ko": "korean",
+}
+SCENE_ALIASES = {
+    "restaurant": "at a restaurant",
+    "shopping": "shopping at a store",
+    "travel": "at a hotel",
+    "directions": "asking for directions",
+    "casual": "meeting new people",
+}
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def normalize(text):
+    """Lowercase words without punctuation, so "¿Dónde está?" and "dónde está" match"""
+    return " ".join(tokenize(text))
+
+
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def pack_key(language, native_language, scene, level):
+    language, native_language = normalize(language or ""), normalize(native_language or "")
+    language = LANGUAGE_ALIASES.get(language, language)
+    native_language = LANGUAGE_ALIASES.get(native_language, native_language)
+    scene = normalize(scene or "")
+    scene = SCENE_ALIASES.get(scene, scene)
+    return f"{language}|{native_language}|{scene}|{normalize(level or '')}"
+
+
+def _encode_record(kind, strings):
+    parts = [RECORD_HEADER.pack(kind, len(strings))]
+    for value in strings:
+        data = (value or "").encode("utf-8")[:0xFFFF]
+        parts.append(STRING_LENGTH.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def write_packs(path, packs):
+    """Write packs to a binary file
+
+    packs maps (language, native_language, scene, level) to a dict with "vocabulary" and "phrases"
+    ([term, translation] pairs) and "common_mistakes" (dicts with mistake, correction,
+    category and explanation).
+    """
+    directory_size = HEADER.size + DIRECTORY_ENTRY.size * len(packs)
+    body = bytearray()
+    keys = bytearray()
+    entries = []
+
+    for (language, native_language, scene, level), pack in packs.items():
+        records = []
+        for kind, items in ((KIND_WORD, pack.get("vocabulary", [])), (KIND_PHRASE, pack.get("phrases", []))):
+            for term, translation in items:
+                records.append((normalize(term), kind, [term, translation]))
+        for mistake in pack.get("common_mistakes", []):
+            records.append((normalize(mistake["mistake"]), KIND_MISTAKE, [
+                mistake["mistake"], mistake.get("correction", ""),
+                mistake.get("category", ""), mistake.get("explanation", "")
+            ]))
+
+        records_start = directory_size + len(body)
+        table = {}
+        for term, kind, strings in records:
+            if not term or term_hash(term) in table:
+                continue  # Empty or duplicate term: the first entry wins
+            table[term_hash(term)] = directory_size + len(body)
+            body += _encode_record(kind, strings)
+        records_end = directory_size + len(body)
+
+        table_offset = records_end
+        for digest in sorted(table):
+            body += TABLE_ENTRY.pack(digest, table[digest])
+
+        key = pack_key(language, native_language, scene, level).encode("utf-8")
+        longest = max((len(term.split()) for term, _, _ in records if term), default=1)
+        entries.append([len(keys), len(key), records_start, records_end, table_offset, len(table), longest])
+        keys += key
+
+    keys_offset = directory_size + len(body)
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(packs)))
+        for entry in entries:
+            entry[0] += keys_offset
+            f.write(DIRECTORY_ENTRY.pack(*entry))
+        f.write(body)
+        f.write(keys)
+    # Running workers keep their mapping of the old file; new workers see the new one
+    os.replace(path + ".tmp", path)
+
+
+class VocabPack:
+    """Read-only view of one (language, native language, scene, level) pack inside the mapped file"""
+
+    def __init__(self, buffer, records_start, records_end, table_offset, table_size, longest_term):
+        self._buffer = buffer
+        self._records = (records_start, records_end)
+        self._table_offset = table_offset
+        self._table_size = table_size
+        self.longest_term = longest_term
+
+    def _read_record(self, offset):
+        kind, count = RECORD_HEADER.unpack_from(self._buffer, offset)
+        offset += RECORD_HEADER.size
+        strings = []
+        for _ in range(count):
+            (length,) = STRING_LENGTH.unpack_from(self._buffer, offset)
+            offset += STRING_LENGTH.size
+            strings.append(bytes(self._buffer[offset:offset + length]).decode("utf-8"))
+            offset += length
+        return kind, strings, offset
+
+    def lookup(self, term):
+        """Return (kind, strings) for a normalized term, or None (binary search over the hash table)"""
+        digest = term_hash(term)
+        low, high = 0, self._table_size
+        while low < high:
+            middle = (low + high) // 2
+            entry_digest, record_offset = TABLE_ENTRY.unpack_from(
+                self._buffer, self._table_offset + middle * TABLE_ENTRY.size
+            )
+            if entry_digest < digest:
+                low = middle + 1
+            elif entry_digest > digest:
+                high = middle
+            else:
+                kind, strings, _ = self._read_record(record_offset)
+                return (kind, strings) if normalize(strings[0]) == term else None
+        return None
+
+    def scan(self, text):
+        """Find pack terms in text, longest match first, without overlaps"""
+        tokens = tokenize(text)
+        matches = []
+        position = 0
+        while position < len(tokens):
+            for size in range(min(self.longest_term, len(tokens) - position), 0, -1):
+                found = self.lookup(" ".join(tokens[position:position + size]))
+                if found:
+                    matches.append(found)
+                    position += size
+                    break
+            else:
+                position += 1
+        return matches
+
+    def entries(self, kinds=None):
+        """Yield (kind, strings) in the order the pack was built (most useful first)"""
+        offset, end = self._records
+        while offset < end:
+            kind, strings, offset = self._read_record(offset)
+            if kinds is None or kind in kinds:
+                yield kind, strings
+
+
+class VocabPacks:
+    """All packs of a pack file, memory-mapped so worker processes share one copy in the page cache"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} vocabulary pack file")
+
+        self.packs = {}
+        for index in range(count):
+            key_offset, key_length, start, end, table_offset, table_size, longest = DIRECTORY_ENTRY.unpack_from(
+                self._map, HEADER.size + index * DIRECTORY_ENTRY.size
+            )
+            key = self._map[key_offset:key_offset + key_length].decode("utf-8")
+            self.packs[key] = VocabPack(self._map, start, end, table_offset, table_size, longest)
+
+    def get(self, language, native_language, scene, level):
+        """The pack for a session; None when no pack was built for the learner's native language"""
+        return self.packs.get(pack_key(language, native_language, scene, level))
+
+
+_shared_packs = None
+_shared_packs_lock = threading.Lock()
+
+
+def get_vocab_packs():
+    """Process-wide packs from VOCAB_PACK_PATH, or None when no pack file has been built"""
+    global _shared_packs
+    with _shared_packs_lock:
+        if _shared_packs is None:
+            path = os.getenv("VOCAB_PACK_PATH", "vocab_packs.bin")
+            try:
+                _shared_packs = VocabPacks(path)
+            except FileNotFoundError:
+                _shared_packs = False
+            except Exception as e:
+                print(f"Error loading vocabulary packs: {str(e)}")
+                _shared_packs = False
+        return _shared_packs or None
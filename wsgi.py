@@ -0,0 +1,9 @@
+from async_support import monkey_patch
+
+# Patch the standard library before the app (and the OpenAI client) import socket or ssl
+monkey_patch()
+
+from app import app, socketio  # noqa: E402
+
+if __name__ == '__main__':
+    socketio.run(app)